@@ -0,0 +1,372 @@
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import Histogram
+
+WAIT_SECONDS_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Priority classes: interactive (chat queries) goes first, bulk (indexing) yields
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class Overloaded(Exception):
+    """A priority class's queue is full. Callers answer `status` with Retry-After."""
+
+    def __init__(self, priority: str, status: int, retry_after: int):
+        super().__init__(f"{priority} queue is full")
+        self.priority = priority
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Pending:
+    __slots__ = ("texts", "future", "tokens", "func", "enqueued_at")
+
+    def __init__(self, texts: List[str], future: asyncio.Future, tokens: int, func=None):
+        self.texts = texts
+        self.future = future
+        self.tokens = tokens
+        self.func = func  # run_bulk job: dispatched alone through func
+        self.enqueued_at = time.perf_counter()
+
+
+class _Lane:
+    """Queue, concurrency limit and counters of one priority class."""
+
+    def __init__(self, name: str, concurrency: int, queue_limit: int, overload_status: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_limit = queue_limit
+        self.overload_status = overload_status
+        self.queue: Optional[asyncio.Queue] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.carry: Optional[_Pending] = None
+        self.collecting = 0  # batches taken off the queue, not yet dispatched
+        self.in_flight = 0
+        self.rejected = 0
+        self.batch_seconds = 0.0  # moving average, for Retry-After
+
+    def depth(self) -> int:
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return depth + (1 if self.carry is not None else 0)
+
+    def retry_after(self) -> int:
+        backlog = (self.depth() + self.in_flight) / self.concurrency
+        return max(1, math.ceil(backlog * self.batch_seconds))
+
+
+class BatcherStats:
+    def __init__(self):
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_batch_size = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.max_queue_depth = 0
+        self.wait_seconds = Histogram(
+            "embedding_queue_wait_seconds", "Time from submit until a request's batch is dispatched",
+            WAIT_SECONDS_BUCKETS, label="priority",
+        )
+
+    def record(self, batch: List[_Pending], size: int, dispatched_at: float, priority: str):
+        self.batches += 1
+        self.requests += len(batch)
+        self.texts += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        for item in batch:
+            wait_ms = (dispatched_at - item.enqueued_at) * 1000
+            self.wait_seconds.observe(wait_ms / 1000, priority)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+
+class MicroBatcher:
+    """Coalesces concurrent embed calls into shared engine runs.
+
+    A batch is dispatched once `max_wait_ms` has passed since its first
+    request, or as soon as it reaches `max_batch_size` texts or an estimated
+    `max_batch_tokens`. Each caller gets back only its own rows.
+
+    Requests belong to one of two priority classes, each with its own
+    bounded queue and concurrency limit: `interactive` (calls with at most
+    `interactive_max_texts` texts, unless they ask for bulk) and `bulk`;
+    `run_bulk` puts other engine calls in the bulk class too. Up to
+    `concurrency` interactive and `bulk_concurrency` bulk batches run at
+    once on `executor`. A bulk batch runs `bulk_chunk` texts at a time and,
+    before each chunk, waits until no interactive work is queued or
+    running, so a chat query waits for at most one chunk. A submit to a
+    full queue raises Overloaded straight away: 503 for interactive, 429
+    for bulk.
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_wait_ms: float = 3.0,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8192,
+        executor=None,
+        concurrency: int = 1,
+        bulk_concurrency: int = 1,
+        interactive_queue_limit: int = 256,
+        bulk_queue_limit: int = 16,
+        interactive_max_texts: int = 4,
+        bulk_chunk: Optional[int] = None,
+    ):
+        self.engine = engine
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.interactive_max_texts = interactive_max_texts
+        self.bulk_chunk = bulk_chunk or max_batch_size
+        self.stats = BatcherStats()
+        self.lanes: Dict[str, _Lane] = {
+            INTERACTIVE: _Lane(INTERACTIVE, self.concurrency, interactive_queue_limit, 503),
+            BULK: _Lane(BULK, bulk_concurrency, bulk_queue_limit, 429),
+        }
+
+        self._tasks: List[asyncio.Task] = []
+        self._dispatches = set()
+        self._interactive_idle: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._interactive_idle = asyncio.Event()
+        self._interactive_idle.set()
+        for lane in self.lanes.values():
+            lane.queue = asyncio.Queue()
+            lane.slots = asyncio.Semaphore(lane.concurrency)
+            self._tasks.append(asyncio.create_task(self._run(lane)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def _estimate_tokens(self, texts: List[str]) -> int:
+        # Rough pre-tokenization estimate (~4 chars per token plus specials),
+        # good enough to keep one dispatch from growing unbounded.
+        max_length = self.engine.max_length
+        return sum(min(len(t) // 4 + 2, max_length) for t in texts)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(lane.in_flight for lane in self.lanes.values())
+
+    def queue_depth(self) -> int:
+        return sum(lane.depth() for lane in self.lanes.values())
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {name: lane.depth() for name, lane in self.lanes.items()}
+
+    def priority_of(self, texts: List[str], priority: Optional[str] = None) -> str:
+        """The lane for `texts`. A caller may ask for bulk, but not for
+        interactive beyond `interactive_max_texts`: a large batch there
+        would run unchunked ahead of the chat queries the lane is for."""
+        if priority is not None and priority not in self.lanes:
+            raise ValueError(f"priority must be one of {PRIORITIES}")
+        if len(texts) > self.interactive_max_texts:
+            return BULK
+        return priority or INTERACTIVE
+
+    def admit(self, priority: str):
+        """Raise Overloaded if `priority`'s queue is full."""
+        lane = self.lanes[priority]
+        if lane.queue_limit and lane.depth() >= lane.queue_limit:
+            lane.rejected += 1
+            raise Overloaded(lane.name, lane.overload_status, lane.retry_after())
+
+    async def submit(self, texts: List[str], priority: Optional[str] = None, admitted: bool = False) -> np.ndarray:
+        """Embed `texts` in a shared batch. `admitted` skips the queue limit
+        for callers already let in through `admit`, such as a stream that
+        must not fail halfway through."""
+        lane = self.lanes[self.priority_of(texts, priority)]
+        if not admitted:
+            self.admit(lane.name)
+
+        return await self._enqueue(lane, texts)
+
+    async def run_bulk(self, func, texts: List[str]) -> list:
+        """Run `func` on `bulk_chunk`-text slices of `texts` as one bulk job.
+
+        For engine calls that do not go through shared batches (chunked and
+        pooled documents): the job takes a place in the bulk queue, runs in
+        a bulk slot, and each slice waits for interactive work like a bulk
+        batch chunk does. Returns the per-slice results in order.
+        """
+        lane = self.lanes[BULK]
+        self.admit(BULK)
+        return await self._enqueue(lane, texts, func)
+
+    async def _enqueue(self, lane: _Lane, texts: List[str], func=None):
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.put_nowait(_Pending(texts, future, self._estimate_tokens(texts), func))
+        if lane.name == INTERACTIVE:
+            self._interactive_idle.clear()
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue_depth())
+        return await future
+
+    def _update_interactive_idle(self):
+        lane = self.lanes[INTERACTIVE]
+        if lane.depth() == 0 and lane.collecting == 0 and lane.in_flight == 0:
+            self._interactive_idle.set()
+
+    async def _next(self, lane: _Lane, timeout: Optional[float]) -> Optional[_Pending]:
+        if lane.carry is not None:
+            item, lane.carry = lane.carry, None
+            return item
+        if timeout is None:
+            return await lane.queue.get()
+        try:
+            return await asyncio.wait_for(lane.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _collect(self, lane: _Lane) -> List[_Pending]:
+        loop = asyncio.get_running_loop()
+        first = await self._next(lane, None)
+        # Busy from here on, not only once dispatched: otherwise bulk work
+        # sees an idle interactive lane while this batch is still filling
+        lane.collecting += 1
+        batch = [first]
+        if first.func is not None:
+            return batch
+        size, tokens = len(first.texts), first.tokens
+        deadline = loop.time() + self.max_wait
+
+        try:
+            while size < self.max_batch_size and tokens < self.max_batch_tokens:
+                item = await self._next(lane, max(deadline - loop.time(), 0))
+                if item is None:
+                    break
+                if (
+                    item.func is not None
+                    or size + len(item.texts) > self.max_batch_size
+                    or tokens + item.tokens > self.max_batch_tokens
+                ):
+                    lane.carry = item
+                    break
+                batch.append(item)
+                size += len(item.texts)
+                tokens += item.tokens
+        except BaseException:
+            lane.collecting -= 1
+            raise
+
+        return batch
+
+    async def _run(self, lane: _Lane):
+        while True:
+            await lane.slots.acquire()
+            try:
+                batch = await self._collect(lane)
+            except BaseException:
+                lane.slots.release()
+                raise
+
+            lane.collecting -= 1
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                lane.slots.release()
+                if lane.name == INTERACTIVE:
+                    self._update_interactive_idle()
+                continue
+            lane.in_flight += 1
+            task = asyncio.create_task(self._dispatch(lane, batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _embed(self, lane: _Lane, texts: List[str], func=None):
+        loop = asyncio.get_running_loop()
+        if func is None and (lane.name == INTERACTIVE or len(texts) <= self.bulk_chunk):
+            if lane.name == BULK:
+                await self._interactive_idle.wait()
+            return await loop.run_in_executor(self.executor, self.engine.embed_array, texts)
+
+        if func is None:
+            vectors = np.empty((len(texts), self.engine.dimension), dtype=np.float32)
+        else:
+            vectors = []
+        for start in range(0, len(texts), self.bulk_chunk):
+            # Interactive work goes first: hold the next chunk until it is done
+            await self._interactive_idle.wait()
+            end = start + self.bulk_chunk
+            if func is None:
+                vectors[start:end] = await loop.run_in_executor(self.executor, self.engine.embed_array, texts[start:end])
+            else:
+                vectors.append(await loop.run_in_executor(self.executor, func, texts[start:end]))
+        return vectors
+
+    async def _dispatch(self, lane: _Lane, batch: List[_Pending]):
+        texts = [text for item in batch for text in item.texts]
+        started = time.perf_counter()
+        self.stats.record(batch, len(texts), started, lane.name)
+
+        try:
+            vectors = await self._embed(lane, texts, batch[0].func)
+        except Exception as exc:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(exc)
+            return
+        finally:
+            lane.in_flight -= 1
+            lane.slots.release()
+            lane.batch_seconds = 0.8 * lane.batch_seconds + 0.2 * (time.perf_counter() - started)
+            if lane.name == INTERACTIVE:
+                self._update_interactive_idle()
+
+        if batch[0].func is not None:
+            if not batch[0].future.done():
+                batch[0].future.set_result(vectors)
+            return
+        offset = 0
+        for item in batch:
+            end = offset + len(item.texts)
+            if not item.future.done():
+                item.future.set_result(vectors[offset:end])
+            offset = end
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "requests": stats.requests,
+            "batches": stats.batches,
+            "texts": stats.texts,
+            "avg_batch_size": round(stats.texts / stats.batches, 2) if stats.batches else 0.0,
+            "max_batch_size": stats.max_batch_size,
+            "avg_wait_ms": round(stats.total_wait_ms / stats.requests, 3) if stats.requests else 0.0,
+            "max_wait_ms": round(stats.max_wait_ms, 3),
+            "queue_depth": self.queue_depth(),
+            "in_flight": self.in_flight,
+            "max_queue_depth": stats.max_queue_depth,
+            "window_ms": self.max_wait * 1000,
+            "concurrency": self.concurrency,
+            "limit_batch_size": self.max_batch_size,
+            "limit_batch_tokens": self.max_batch_tokens,
+            "interactive_max_texts": self.interactive_max_texts,
+            "bulk_chunk": self.bulk_chunk,
+            "classes": {
+                name: {
+                    "queue_depth": lane.depth(),
+                    "queue_limit": lane.queue_limit,
+                    "in_flight": lane.in_flight,
+                    "concurrency": lane.concurrency,
+                    "rejected": lane.rejected,
+                    "avg_batch_ms": round(lane.batch_seconds * 1000, 3),
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Build a model variant with masked mean pooling and L2 normalization fused
+into the graph, so the session returns `sentence_embedding` [batch, hidden]
+instead of the full [batch, seq, hidden] token embeddings.
+
+Writes <name>_fused.onnx next to the model; IndonesianEmbeddingEngine picks
+it up automatically. Needs the `onnx` package, which the service does not:
+    python build_fused_model.py onnx/indonesian_embedding.onnx --check
+    python build_fused_model.py onnx/indonesian_embedding_q8.onnx --check
+
+--check is the parity gate: the service does not repeat it at startup
+unless EMBED_VERIFY_FUSED=1. Re-run export_shared_weights.py on the fused
+file for shared-weight serving.
+"""
+
+import argparse
+import tracemalloc
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from embedding_engine import FUSED_OUTPUT, IndonesianEmbeddingEngine, fused_model_path
+
+
+def build(model_path: str, output_path: str) -> str:
+    model = onnx.load(model_path)
+    graph = model.graph
+    if "attention_mask" not in {i.name for i in graph.input}:
+        raise ValueError("model has no attention_mask input to pool with")
+    if any(o.name == FUSED_OUTPUT for o in graph.output):
+        raise ValueError(f"{model_path} already has a {FUSED_OUTPUT} output")
+
+    token_output = graph.output[0]
+    hidden = token_output.name
+    elem_type = token_output.type.tensor_type.elem_type
+    dims = token_output.type.tensor_type.shape.dim
+    hidden_size = dims[-1].dim_value if dims and dims[-1].HasField("dim_value") else None
+
+    def name(suffix: str) -> str:
+        return f"fused_pooling/{suffix}"
+
+    graph.initializer.extend([
+        numpy_helper.from_array(np.array([1], dtype=np.int64), name("axis1")),
+        numpy_helper.from_array(
+            np.array([1e-9], dtype=helper.tensor_dtype_to_np_dtype(elem_type)), name("min_count")
+        ),
+    ])
+    graph.node.extend([
+        # mask [b, s] -> [b, 1, s] in the hidden dtype
+        helper.make_node("Cast", ["attention_mask"], [name("mask")], to=elem_type),
+        helper.make_node("Unsqueeze", [name("mask"), name("axis1")], [name("mask_row")]),
+        # [b, 1, s] @ [b, s, h] = masked sum over tokens without a [b, s, h] temporary
+        helper.make_node("MatMul", [name("mask_row"), hidden], [name("summed_3d")]),
+        helper.make_node("Squeeze", [name("summed_3d"), name("axis1")], [name("summed")]),
+        helper.make_node("ReduceSum", [name("mask"), name("axis1")], [name("count")], keepdims=1),
+        helper.make_node("Max", [name("count"), name("min_count")], [name("count_clipped")]),
+        helper.make_node("Div", [name("summed"), name("count_clipped")], [name("mean")]),
+        helper.make_node("LpNormalization", [name("mean")], [FUSED_OUTPUT], axis=-1, p=2),
+    ])
+
+    # Only the pooled output leaves the session; token embeddings stay internal
+    del graph.output[:]
+    graph.output.append(helper.make_tensor_value_info(FUSED_OUTPUT, elem_type, ["batch", hidden_size]))
+
+    opset = next((o.version for o in model.opset_import if o.domain in ("", "ai.onnx")), 0)
+    if opset < 13:
+        raise ValueError(f"opset {opset} too old: Squeeze/Unsqueeze/ReduceSum need axes inputs (opset >= 13)")
+
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+    return output_path
+
+
+def check(model_path: str, tokenizer_path: str, batch: int = 64, length: int = 384):
+    """Parity and Python-side peak allocation, NumPy pooling vs fused graph."""
+    words = ("pengumuman jadwal ujian semester mahasiswa program studi informatika "
+             "beasiswa prestasi dosen penelitian kerja sama mitra kampus").split()
+    texts = [" ".join(words[(i + j) % len(words)] for j in range(length)) for i in range(batch)]
+
+    results = {}
+    for fused in (False, True):
+        engine = IndonesianEmbeddingEngine(
+            model_path=model_path, tokenizer_path=tokenizer_path, max_length=length,
+            max_batch_size=batch, max_batch_tokens=batch * length, fused=fused,
+        )
+        engine.embed_array(texts[:2])
+        tracemalloc.start()
+        vectors = engine.embed_array(texts)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[fused] = (vectors, peak)
+
+    diff = float(np.abs(results[True][0] - results[False][0]).max())
+    print(f"max abs diff vs NumPy pooling: {diff:.2e}")
+    print(f"peak Python allocation for {batch}x{length}: "
+          f"{results[False][1] / 2**20:.1f} MB unfused -> {results[True][1] / 2**20:.2f} MB fused")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuse mean pooling + L2 normalize into an ONNX model")
+    parser.add_argument("models", nargs="+")
+    parser.add_argument("--check", action="store_true", help="compare against the NumPy pooling path")
+    parser.add_argument("--tokenizer", default="./onnx/tokenizer.json")
+    args = parser.parse_args()
+
+    for model_path in args.models:
+        output = build(model_path, fused_model_path(model_path))
+        print(f"{model_path} -> {output}")
+        if args.check:
+            check(model_path, args.tokenizer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate groups and topic clusters over stored embeddings.
+
+duplicate_groups() runs a blockwise cosine self-join: only one
+[block, block] tile of scores exists at a time, so memory stays at
+block^2 floats however many vectors there are. Pairs at or above the
+threshold are merged with union-find into groups. minibatch_kmeans()
+clusters normalized vectors by cosine with mini-batch updates.
+
+Usage (from the embedding-model directory, over a VECTOR_INDEX_DIR table):
+    python dedup.py duplicates --table announcement --threshold 0.95
+    python dedup.py clusters --table knowledge --k 20
+"""
+
+import argparse
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import vector_index
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def similar_pairs(vectors: np.ndarray, threshold: float, block: int = 2048) -> Iterator[Tuple[np.ndarray, ...]]:
+    """(i, j, score) arrays per tile for every pair i < j with score >= threshold."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    for start in range(0, n, block):
+        rows = vectors[start:start + block]
+        # Upper triangle only: tiles from the diagonal onwards
+        for other in range(start, n, block):
+            scores = rows @ vectors[other:other + block].T
+            i, j = np.nonzero(scores >= threshold)
+            i += start
+            j += other
+            keep = i < j
+            if keep.any():
+                yield i[keep], j[keep], scores[i[keep] - start, j[keep] - other]
+
+
+def duplicate_groups(vectors: np.ndarray, threshold: float = 0.95, block: int = 2048,
+                     max_pairs: Optional[int] = None) -> Tuple[List[np.ndarray], int]:
+    """Groups (index arrays, largest first) of vectors linked by pairs >= threshold,
+    and the number of such pairs.
+
+    Raises ValueError as soon as more than `max_pairs` pairs turn up: a low
+    threshold links O(n^2) pairs, each merged in Python.
+    """
+    groups = UnionFind(len(vectors))
+    pairs = 0
+    for left, right, _ in similar_pairs(vectors, threshold, block):
+        pairs += len(left)
+        if max_pairs is not None and pairs > max_pairs:
+            raise ValueError(f"more than {max_pairs} pairs at threshold {threshold}; raise the threshold")
+        for a, b in zip(left.tolist(), right.tolist()):
+            groups.union(a, b)
+
+    roots = np.fromiter((groups.find(i) for i in range(len(vectors))), dtype=np.intp, count=len(vectors))
+    order = np.argsort(roots, kind="stable")
+    bounds = np.flatnonzero(np.diff(roots[order])) + 1
+    members = [m for m in np.split(order, bounds) if len(m) > 1]
+    members.sort(key=len, reverse=True)
+    return members, pairs
+
+
+def minibatch_kmeans(vectors: np.ndarray, k: int, batch: int = 1024, iters: int = 100,
+                     seed: int = 0, block: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical mini-batch k-means: ([k, dim] unit centroids, labels).
+
+    Each step assigns one random mini-batch to its most similar centroids
+    and moves them by a per-centroid learning rate of 1 / points seen.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    seen = np.zeros(k, dtype=np.int64)
+
+    for _ in range(iters):
+        sample = vectors[rng.choice(len(vectors), min(batch, len(vectors)), replace=False)]
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        hit = counts > 0
+        seen[hit] += counts[hit]
+        rate = (counts[hit] / seen[hit])[:, None]
+        centroids[hit] = (1 - rate) * centroids[hit] + rate * sums[hit] / counts[hit, None]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-9)
+
+    labels = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), block):
+        labels[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return centroids, labels
+
+
+def load_table(directory: str, table: str):
+    """Vectors (memory-mapped while the table has no journal) and row ids of one VectorIndex table."""
+    index = vector_index.load_table(directory, table)
+    return index.vectors, index.row_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate groups and clusters of an index table")
+    parser.add_argument("command", choices=("duplicates", "clusters"))
+    parser.add_argument("--index", default=os.getenv("VECTOR_INDEX_DIR", "./index"))
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--block", type=int, default=2048)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--output", default=None, help="write the result as JSON")
+    args = parser.parse_args()
+
+    vectors, row_ids = load_table(args.index, args.table)
+    if args.command == "duplicates":
+        groups, pairs = duplicate_groups(vectors, args.threshold, args.block)
+        result = {"pairs": pairs, "groups": [[row_ids[i] for i in group] for group in groups]}
+        print(f"{args.table}: {len(row_ids)} rows, {pairs} pairs >= {args.threshold}, {len(groups)} groups")
+    else:
+        _, labels = minibatch_kmeans(vectors, args.k)
+        clusters = {}
+        for row_id, label in zip(row_ids, labels.tolist()):
+            clusters.setdefault(label, []).append(row_id)
+        result = {"clusters": sorted(clusters.values(), key=len, reverse=True)}
+        print(f"{args.table}: {len(row_ids)} rows in {len(clusters)} clusters,"
+              f" sizes {[len(c) for c in result['clusters']]}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+
+def cache_key(model_id: str, max_length: int, text: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{model_id}\0{max_length}\0".encode("utf-8"))
+    # The raw text: the Metaspace tokenizer encodes edge whitespace as its
+    # own token, so texts differing only in spacing can embed differently
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of embedding vectors.
+
+    Vectors live as float32 rows of one preallocated [capacity, dimension]
+    matrix; the LRU order only tracks which key owns which row, so evicting
+    an entry just hands its row to the next key.
+    """
+
+    def __init__(self, capacity: int, dimension: int):
+        self.capacity = capacity
+        self.dimension = dimension
+        self._rows = np.empty((capacity, dimension), dtype=np.float32)
+        self._slots: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def lookup(self, keys: List[bytes], out: np.ndarray) -> List[int]:
+        """Copy cached vectors into the matching rows of `out`.
+
+        Returns the positions in `keys` that were not cached.
+        """
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.append(i)
+                    continue
+                self._slots.move_to_end(key)
+                out[i] = self._rows[slot]
+
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return missing
+
+    def store(self, keys: List[bytes], vectors: np.ndarray):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                slot = self._slots.get(key)
+                if slot is not None:
+                    self._slots.move_to_end(key)
+                elif len(self._slots) < self.capacity:
+                    slot = self._slots[key] = len(self._slots)
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                    self._slots[key] = slot
+                    self.evictions += 1
+                self._rows[slot] = vector
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes": self._rows.nbytes,
+            }
@@ -1,75 +1,423 @@
-import onnxruntime as ort
+import os
+import time
 import numpy as np
 from tokenizers import Tokenizer
-from typing import List
+from typing import List, Optional
+
+from embedding_cache import EmbeddingCache, cache_key
+from metrics import Histogram, Registry
+from session_config import SessionConfig
+from session_pool import SessionPool
+
+# Shipped ONNX exports, selected with MODEL_VARIANT (fp32 unless set)
+MODEL_VARIANTS = {
+    "fp32": "./onnx/indonesian_embedding.onnx",
+    "q8": "./onnx/indonesian_embedding_q8.onnx",
+}
+DEFAULT_VARIANT = "fp32"
+
+# Upper bounds (in tokens) of the length buckets. Texts are sorted by length
+# and each bucket runs as its own session.run, padded only to its longest row.
+LENGTH_BUCKETS = (16, 32, 64, 128, 256)
+
+# build_fused_model.py writes <model>_fused.onnx, whose graph already does the
+# masked mean pooling + L2 normalization and returns this output
+FUSED_OUTPUT = "sentence_embedding"
+FUSED_PARITY_TOLERANCE = 1e-4
+FUSED_PARITY_TEXTS = (
+    "",
+    "Pengumuman jadwal ujian akhir semester",
+    "Beasiswa prestasi untuk mahasiswa program studi teknik informatika " * 8,
+)
+
+# Histogram bounds for the per-stage timers and batch shape metrics
+STAGE_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_ROWS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+BATCH_TOKENS_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+PADDING_RATIO_BUCKETS = (0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75)
+
+# Texts are tokenized this many full batches at a time, so a huge request
+# never holds every Encoding at once
+TOKENIZE_GROUP_BATCHES = 8
+
+
+def fused_model_path(model_path: str) -> str:
+    base, ext = os.path.splitext(model_path)
+    return f"{base}_fused{ext}"
 
 
 class IndonesianEmbeddingEngine:
     def __init__(
         self,
-        model_path: str = "./onnx/indonesian_embedding.onnx",
+        model_path: Optional[str] = None,
         tokenizer_path: str = "./onnx/tokenizer.json",
         max_length: int = 384,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 16384,
+        chunk_overlap: int = 64,
+        pool_size: int = 1,
+        intra_op_threads: int = 0,
+        cache_size: int = 0,
+        model_id: Optional[str] = None,
+        variant: Optional[str] = None,
+        session_config: Optional[SessionConfig] = None,
+        fused: Optional[bool] = None,
+        verify_fused: bool = False,
+        io_binding: bool = True,
     ):
+        self.variant = variant or os.getenv("MODEL_VARIANT", DEFAULT_VARIANT)
+        if model_path is None:
+            if self.variant not in MODEL_VARIANTS:
+                raise ValueError(
+                    f"Unknown model variant {self.variant!r}, expected one of {sorted(MODEL_VARIANTS)}"
+                )
+            model_path = MODEL_VARIANTS[self.variant]
+
+        # Prefer the fused-pooling export when it sits next to the model
+        self.base_model_path = model_path
+        if fused is None:
+            fused = os.path.exists(fused_model_path(model_path))
+        if fused:
+            model_path = fused_model_path(model_path)
+
+        self.model_path = model_path
         self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        # The fused export yields the same vectors, so it shares the base model id
+        self.model_id = model_id or os.path.basename(self.base_model_path)
 
-        # Load tokenizer
+        # Milliseconds spent per cold-start phase, for startup logs
+        self.load_timings = {}
+        start = time.perf_counter()
+
+        # Load tokenizer (truncation only, padding is done per bucket)
         self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()
 
-        # Load ONNX model
-        self.session = ort.InferenceSession(
-            model_path,
-            providers=["CPUExecutionProvider"]
-        )
+        # Second copy for chunking: long texts overflow into further windows
+        # that repeat the last `chunk_overlap` tokens of the previous one
+        if not 0 <= chunk_overlap < max_length // 2:
+            raise ValueError(f"chunk_overlap must be between 0 and {max_length // 2 - 1}")
+        self.chunk_overlap = chunk_overlap
+        self.chunk_tokenizer = Tokenizer.from_str(self.tokenizer.to_str())
+        self.chunk_tokenizer.enable_truncation(max_length, stride=chunk_overlap)
+        self.load_timings["tokenizer"] = (time.perf_counter() - start) * 1000
+
+        # Per-stage timers and batch shape histograms, rendered at /metrics
+        self.metrics = Registry()
+        self.stage_seconds = self.metrics.add(Histogram(
+            "embedding_stage_seconds", "Time spent per embedding stage",
+            STAGE_SECONDS_BUCKETS, label="stage",
+        ))
+        self.batch_rows = self.metrics.add(Histogram(
+            "embedding_batch_rows", "Rows per session.run", BATCH_ROWS_BUCKETS,
+        ))
+        self.batch_tokens = self.metrics.add(Histogram(
+            "embedding_batch_tokens", "Padded tokens (rows x sequence length) per session.run",
+            BATCH_TOKENS_BUCKETS,
+        ))
+        self.padding_ratio = self.metrics.add(Histogram(
+            "embedding_batch_padding_ratio", "Share of padding tokens per session.run",
+            PADDING_RATIO_BUCKETS,
+        ))
+
+        # Load ONNX model, one session per concurrent inference
+        start = time.perf_counter()
+        self.pool = SessionPool(model_path, pool_size, intra_op_threads, session_config)
+        self.session = self.pool.sessions[0]
+        self.load_timings["session"] = (time.perf_counter() - start) * 1000
 
         self.input_names = {i.name for i in self.session.get_inputs()}
+        outputs = self.session.get_outputs()
+        self.fused = any(o.name == FUSED_OUTPUT for o in outputs)
+        self.output_name = FUSED_OUTPUT if self.fused else outputs[0].name
+
+        output = next(o for o in outputs if o.name == self.output_name)
+        if isinstance(output.shape[-1], int):
+            self.dimension = output.shape[-1]
+        else:
+            input_ids, attention_mask = self._pad(*self._tokenize([""]), np.arange(1))
+            self.dimension = self._run(self.session, input_ids, attention_mask).shape[-1]
+
+        # Opt-in, since it loads the unfused model next to the fused one
+        # (build_fused_model.py --check runs the same comparison offline).
+        # A fused export that disagrees with NumPy pooling is not used.
+        self.fused_max_diff = None
+        if self.fused and verify_fused:
+            self.fused_max_diff = self.check_fused_parity()
+            if self.fused_max_diff > FUSED_PARITY_TOLERANCE:
+                self.fused = False
+                self.model_path = self.base_model_path
+                # Drop the fused sessions before the base model loads
+                self.pool = self.session = None
+                self.pool = SessionPool(self.base_model_path, pool_size, intra_op_threads, session_config)
+                self.session = self.pool.sessions[0]
+                output = self.session.get_outputs()[0]
+                self.output_name = output.name
+
+        # Per-session input/output buffers sized for the largest batch the
+        # token budget allows, reused by every run through IO binding
+        self.io_binding = io_binding and output.type == "tensor(float)"
+        self._buffers = {}
+        if self.io_binding:
+            for session in self.pool.sessions:
+                self._buffers[id(session)] = self._allocate_buffers(session)
+        self.pool.on_swap = self._swap_session
+
+        self.cache = EmbeddingCache(cache_size, self.dimension) if cache_size > 0 else None
 
     def _tokenize(self, texts: List[str]):
+        start = time.perf_counter()
         encodings = self.tokenizer.encode_batch(texts)
+        lengths = np.fromiter(
+            (len(enc) for enc in encodings), dtype=np.int64, count=len(encodings)
+        )
+        self.stage_seconds.observe(time.perf_counter() - start, "tokenize")
+        return encodings, lengths
 
-        input_ids = []
-        attention_mask = []
+    def _pad(self, encodings, lengths, rows, buffers=None):
+        seq_len = int(lengths[rows].max())
+        shape = (len(rows), seq_len)
+        if buffers is None:
+            input_ids = np.zeros(shape, dtype=np.int64)
+            attention_mask = np.empty(shape, dtype=np.int64)
+        else:
+            size = shape[0] * shape[1]
+            input_ids = buffers["input_ids"][:size].reshape(shape)
+            input_ids.fill(0)
+            attention_mask = buffers["attention_mask"][:size].reshape(shape)
 
-        for enc in encodings:
-            ids = enc.ids[: self.max_length]
-            mask = [1] * len(ids)
+        for i, row in enumerate(rows):
+            input_ids[i, : lengths[row]] = encodings[row].ids
 
-            pad_len = self.max_length - len(ids)
-            if pad_len > 0:
-                ids += [0] * pad_len
-                mask += [0] * pad_len
+        np.less(np.arange(seq_len), lengths[rows, None], out=attention_mask)
+        return input_ids, attention_mask
 
-            input_ids.append(ids)
-            attention_mask.append(mask)
+    def _plan_batches(self, lengths) -> List[np.ndarray]:
+        # Sort by length, then cut whenever the bucket changes, a batch is full
+        # or one more row would push its padded size past max_batch_tokens
+        order = np.argsort(lengths, kind="stable")
+        buckets = np.searchsorted(LENGTH_BUCKETS, lengths[order])
 
-        return {
-            "input_ids": np.array(input_ids, dtype=np.int64),
-            "attention_mask": np.array(attention_mask, dtype=np.int64),
-        }
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            if (
+                end == len(order)
+                or buckets[end] != buckets[start]
+                or end - start == self.max_batch_size
+                or (end - start + 1) * lengths[order[end]] > self.max_batch_tokens
+            ):
+                batches.append(order[start:end])
+                start = end
+        return batches
 
     def _mean_pooling(self, token_embeddings, attention_mask):
-        mask = attention_mask[..., None]
-        summed = np.sum(token_embeddings * mask, axis=1)
-        counts = np.clip(mask.sum(axis=1), a_min=1e-9, a_max=None)
+        mask = attention_mask.astype(token_embeddings.dtype)
+        # [b, 1, s] @ [b, s, h]: the masked sum without a [b, s, h] temporary
+        summed = np.matmul(mask[:, None, :], token_embeddings)[:, 0, :]
+        counts = np.clip(mask.sum(axis=1, keepdims=True), a_min=1e-9, a_max=None)
         return summed / counts
 
     def _normalize(self, vectors):
         norms = np.linalg.norm(vectors, axis=1, keepdims=True)
         return vectors / norms
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        inputs = self._tokenize(texts)
-
+    def _feed(self, input_ids, attention_mask) -> dict:
         ort_inputs = {}
         if "input_ids" in self.input_names:
-            ort_inputs["input_ids"] = inputs["input_ids"]
+            ort_inputs["input_ids"] = input_ids
         if "attention_mask" in self.input_names:
-            ort_inputs["attention_mask"] = inputs["attention_mask"]
+            ort_inputs["attention_mask"] = attention_mask
+        return ort_inputs
+
+    def _swap_session(self, old, new):
+        """Follow a SessionPool swap: the old session's IO binding holds it alive."""
+        if old is not None:
+            self._buffers.pop(id(old), None)
+        if self.session is old:
+            self.session = new
+        if new is not None and self.io_binding:
+            self._buffers[id(new)] = self._allocate_buffers(new)
+
+    def _allocate_buffers(self, session) -> dict:
+        # _plan_batches keeps rows x padded length within the token budget;
+        # a single row may still be max_length long
+        tokens = max(self.max_batch_tokens, self.max_length)
+        rows = min(self.max_batch_size, tokens)
+        return {
+            "binding": session.io_binding(),
+            "input_ids": np.zeros(tokens, dtype=np.int64),
+            "attention_mask": np.zeros(tokens, dtype=np.int64),
+            "output": np.zeros((rows if self.fused else tokens) * self.dimension, dtype=np.float32),
+        }
+
+    def _run(self, session, input_ids, attention_mask, buffers=None):
+        # [batch, hidden] from a fused model, else [batch, seq, hidden]
+        if buffers is None:
+            return session.run([self.output_name], self._feed(input_ids, attention_mask))[0]
+
+        binding = buffers["binding"]
+        binding.clear_binding_inputs()
+        binding.clear_binding_outputs()
+        for name, array in self._feed(input_ids, attention_mask).items():
+            binding.bind_input(name, "cpu", 0, np.int64, array.shape, array.ctypes.data)
+
+        shape = input_ids.shape[:1] if self.fused else input_ids.shape
+        shape = (*shape, self.dimension)
+        output = buffers["output"][:int(np.prod(shape))].reshape(shape)
+        binding.bind_output(self.output_name, "cpu", 0, np.float32, shape, output.ctypes.data)
+        session.run_with_iobinding(binding)
+        return output
+
+    def check_fused_parity(self, texts=FUSED_PARITY_TEXTS) -> float:
+        """Max abs difference between the fused graph and NumPy pooling over
+        the unfused model, on a few texts of different lengths."""
+        reference = SessionPool(self.base_model_path, 1, self.pool.intra_op_threads).sessions[0]
+        encodings, lengths = self._tokenize(list(texts))
+        rows = np.arange(len(texts))
+        input_ids, attention_mask = self._pad(encodings, lengths, rows)
+        feed = self._feed(input_ids, attention_mask)
+
+        token_embeddings = reference.run(None, feed)[0]
+        expected = self._normalize(self._mean_pooling(token_embeddings, attention_mask))
+        actual = self.session.run([FUSED_OUTPUT], feed)[0]
+        return float(np.abs(actual - expected).max())
+
+    def warmup(self, lengths=(16, 64, 128, 384), batch_sizes=(1, 16)) -> float:
+        """Run every pooled session once per (batch size, sequence length).
+
+        The first run of a shape pays for ORT's arena growth and kernel
+        setup; doing it here keeps that cost off the first real requests.
+        Returns the elapsed milliseconds.
+        """
+        start = time.perf_counter()
+        filler = self.tokenizer.encode("warmup").ids
+        for length in sorted({min(int(n), self.max_length) for n in lengths}):
+            ids = np.resize(np.asarray(filler, dtype=np.int64), length)
+            ids[0], ids[-1] = filler[0], filler[-1]
+            for batch_size in batch_sizes:
+                input_ids = np.tile(ids, (batch_size, 1))
+                feed = self._feed(input_ids, np.ones_like(input_ids))
+                for session in self.pool.sessions:
+                    session.run(None, feed)
+        self.load_timings["warmup"] = (time.perf_counter() - start) * 1000
+        return self.load_timings["warmup"]
+
+    def _embed_uncached(self, texts: List[str], out=None, out_rows=None) -> np.ndarray:
+        """Embed texts into out[out_rows] (a new array when out is None)."""
+        if out is None:
+            out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if out_rows is None:
+            out_rows = np.arange(len(texts))
+
+        group = self.max_batch_size * TOKENIZE_GROUP_BATCHES
+        for start in range(0, len(texts), group):
+            encodings, lengths = self._tokenize(texts[start:start + group])
+            self._embed_encodings(encodings, lengths, out, out_rows[start:start + group])
+        return out
+
+    def _embed_encodings(self, encodings, lengths, out=None, out_rows=None) -> np.ndarray:
+        if out is None:
+            out = np.empty((len(encodings), self.dimension), dtype=np.float32)
+
+        observe = self.stage_seconds.observe
+        for rows in self._plan_batches(lengths):
+            # The session's buffers hold the batch until it is pooled, so the
+            # session stays checked out for pad and pooling too
+            with self.pool.session() as session:
+                buffers = self._buffers.get(id(session))
+                start = time.perf_counter()
+                input_ids, attention_mask = self._pad(encodings, lengths, rows, buffers)
+                padded_at = time.perf_counter()
+                output = self._run(session, input_ids, attention_mask, buffers)
+                ran_at = time.perf_counter()
+                if not self.fused:
+                    output = self._normalize(self._mean_pooling(output, attention_mask))
+                out[rows if out_rows is None else out_rows[rows]] = output
+            done = time.perf_counter()
 
-        outputs = self.session.run(None, ort_inputs)
+            observe(padded_at - start, "pad")
+            observe(ran_at - padded_at, "inference")
+            observe(done - ran_at, "pooling")
+            self.batch_rows.observe(len(rows))
+            self.batch_tokens.observe(input_ids.size)
+            self.padding_ratio.observe(1 - float(lengths[rows].sum()) / input_ids.size)
 
-        token_embeddings = outputs[0]  # [batch, seq, hidden]
-        pooled = self._mean_pooling(token_embeddings, inputs["attention_mask"])
-        normalized = self._normalize(pooled)
+        return out
 
-        return normalized.tolist()
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 [len(texts), hidden] array, in input order.
+
+        Duplicate texts are embedded once, and only cache misses reach the
+        ONNX session.
+        """
+        keys = [cache_key(self.model_id, self.max_length, text) for text in texts]
+
+        positions = {}
+        unique_texts, unique_keys = [], []
+        inverse = np.empty(len(texts), dtype=np.intp)
+        for i, key in enumerate(keys):
+            j = positions.get(key)
+            if j is None:
+                j = positions[key] = len(unique_keys)
+                unique_keys.append(key)
+                unique_texts.append(texts[i])
+            inverse[i] = j
+
+        vectors = np.empty((len(unique_keys), self.dimension), dtype=np.float32)
+        if self.cache is not None:
+            missing = self.cache.lookup(unique_keys, vectors)
+        else:
+            missing = list(range(len(unique_keys)))
+
+        if missing:
+            rows = np.asarray(missing, dtype=np.intp)
+            self._embed_uncached([unique_texts[i] for i in missing], vectors, rows)
+            if self.cache is not None:
+                self.cache.store([unique_keys[i] for i in missing], vectors[rows])
+
+        if len(unique_keys) == len(texts):
+            return vectors
+        return vectors[inverse]
+
+    def embed_chunks(self, texts: List[str]):
+        """Embed every overlapping max_length window of every text.
+
+        Windows of all texts are batched together. Returns (vectors, documents,
+        offsets): float32 [chunks, hidden] vectors, the index of the text each
+        chunk came from, and [chunks, 2] character offsets (start, end) of the
+        chunk inside that text. Chunks bypass the embedding cache.
+        """
+        start = time.perf_counter()
+        encodings, documents, offsets = [], [], []
+        for doc, encoding in enumerate(self.chunk_tokenizer.encode_batch(texts)):
+            for window in [encoding] + encoding.overflowing:
+                content = [
+                    offset
+                    for offset, special in zip(window.offsets, window.special_tokens_mask)
+                    if not special
+                ]
+                encodings.append(window)
+                documents.append(doc)
+                offsets.append((content[0][0], content[-1][1]) if content else (0, 0))
+
+        lengths = np.fromiter((len(enc) for enc in encodings), dtype=np.int64, count=len(encodings))
+        self.stage_seconds.observe(time.perf_counter() - start, "tokenize")
+        vectors = self._embed_encodings(encodings, lengths)
+        return vectors, np.array(documents, dtype=np.intp), np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """One vector per text covering all of it: the mean of its chunk
+        vectors weighted by the characters each chunk spans, re-normalized."""
+        vectors, documents, offsets = self.embed_chunks(texts)
+        weights = np.maximum(offsets[:, 1] - offsets[:, 0], 1).astype(np.float32)
+
+        pooled = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+        np.add.at(pooled, documents, vectors * weights[:, None])
+        return self._normalize(pooled)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+ANN Benchmark - HNSW index vs exact search
+Builds an HNSWIndex over synthetic normalized 384-d vectors (clustered, so
+neighbourhoods look like real topic structure) and reports build time,
+recall@k against exact brute-force search, and query latency per ef.
+
+Usage (from the embedding-model directory):
+    python eval/ann_benchmark.py --sizes 10000,100000 --ef 16,32,64,128
+    python eval/ann_benchmark.py --sizes 1000000 --queries 200   # slow: pure-Python build
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from common import peak_rss_mb, percentiles, top_k
+from hnsw_index import HNSWIndex
+from vector_index import TableIndex
+
+
+def synthetic_vectors(n: int, dimension: int, rng, clusters: int = 256) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = np.empty((n, dimension), dtype=np.float32)
+    for start in range(0, n, 65536):
+        end = min(start + 65536, n)
+        labels = rng.integers(0, clusters, end - start)
+        block = centers[labels] + rng.standard_normal((end - start, dimension)).astype(np.float32)
+        vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 65536):
+    """Ground truth top-k, scanning the corpus blockwise to bound memory."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), block):
+        scores = queries @ vectors[start:start + block].T
+        ids = top_k(scores, k) + start
+        merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, ids - start, axis=1)], axis=1)
+        merged_ids = np.concatenate([best_ids, ids], axis=1)
+        keep = top_k(merged_scores, k)
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        best_ids = np.take_along_axis(merged_ids, keep, axis=1)
+    return best_ids
+
+
+def run(size: int, args, rng) -> dict:
+    vectors = synthetic_vectors(size, args.dimension, rng)
+    queries = vectors[rng.choice(size, args.queries, replace=False)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.1
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    truth = exact_top_k(vectors, queries, args.k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    # One query per scan through the service's exact path: what a graph query has to beat
+    table = TableIndex(args.dimension, vectors, [str(i) for i in range(size)])
+    single = []
+    for query in queries:
+        start = time.perf_counter()
+        table.search(query, args.k, args.min_score)
+        single.append((time.perf_counter() - start) * 1000)
+
+    index = HNSWIndex(args.dimension, M=args.M, ef_construction=args.ef_construction, capacity=size)
+    start = time.perf_counter()
+    index.add(vectors, [str(i) for i in range(size)])
+    build_s = time.perf_counter() - start
+
+    result = {
+        "size": size,
+        "build_s": round(build_s, 2),
+        "build_us_per_vector": round(build_s * 1e6 / size, 1),
+        "exact_ms_per_query": round(exact_ms, 3),
+        "exact_single_ms": percentiles(single),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "ef": [],
+    }
+
+    for ef in args.ef:
+        latencies, recall = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            labels, _ = index.search(query, args.k, ef)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recall.append(len({int(label) for label in labels} & set(expected.tolist())) / args.k)
+        result["ef"].append({
+            "ef": ef,
+            f"recall_at_{args.k}": round(float(np.mean(recall)), 4),
+            "latency_ms": percentiles(latencies),
+        })
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW recall/latency/build benchmark")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma-separated corpus sizes (1000000 takes hours in pure Python)")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef", default="16,32,64,128")
+    parser.add_argument("--min-score", type=float, default=0.3,
+                        help="score floor of the exact scan, as in /index/search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+    args.ef = [int(v) for v in args.ef.split(",")]
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in (int(v) for v in args.sizes.split(",")):
+        result = run(size, args, rng)
+        results.append(result)
+
+        print("=" * 60)
+        print(f"n={size:,}  build {result['build_s']} s ({result['build_us_per_vector']} us/vector)"
+              f"  exact {result['exact_ms_per_query']} ms/query batched, p50 {result['exact_single_ms']['p50']} ms"
+              f" one at a time  peak RSS {result['peak_rss_mb']} MB")
+        for row in result["ef"]:
+            lat = row["latency_ms"]
+            print(f"  ef={row['ef']:<4} recall@{args.k} {row[f'recall_at_{args.k}']:.4f}"
+                  f"  p50 {lat['p50']} ms  p95 {lat['p95']} ms  p99 {lat['p99']} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Shared helpers for the evaluation and benchmark commands in this directory."""
+
+import json
+import os
+import resource
+import sys
+
+import numpy as np
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.dirname(EVAL_DIR)
+
+if MODEL_DIR not in sys.path:
+    sys.path.insert(0, MODEL_DIR)
+
+
+def model_file(relative_path: str) -> str:
+    return os.path.join(MODEL_DIR, relative_path)
+
+
+def load_eval_set(path: str = None) -> dict:
+    with open(path or os.path.join(EVAL_DIR, "indonesian_eval_set.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_engine(variant: str = "fp32", **kwargs):
+    from embedding_engine import MODEL_VARIANTS, IndonesianEmbeddingEngine
+
+    kwargs.setdefault("model_path", model_file(MODEL_VARIANTS[variant]))
+    kwargs.setdefault("tokenizer_path", model_file("onnx/tokenizer.json"))
+    return IndonesianEmbeddingEngine(variant=variant, **kwargs)
+
+
+def percentiles(samples_ms, points=(50, 95, 99)) -> dict:
+    if len(samples_ms) == 0:
+        return {f"p{p}": None for p in points}
+    values = np.percentile(np.asarray(samples_ms, dtype=np.float64), points)
+    return {f"p{str(p).replace('.', '_')}": round(float(v), 3) for p, v in zip(points, values)}
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, best first."""
+    k = min(k, scores.shape[-1])
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.take_along_axis(scores, part, axis=-1).argsort(axis=-1)[..., ::-1]
+    return np.take_along_axis(part, order, axis=-1)
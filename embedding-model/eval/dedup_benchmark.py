@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Dedup Benchmark - near-duplicate self-join and mini-batch k-means at scale
+Builds synthetic clustered 384-d vectors, plants a share of near-duplicate
+copies (the original plus small noise), then times dedup.duplicate_groups
+and dedup.minibatch_kmeans. Reports runtime, peak NumPy allocation
+(tracemalloc) next to the size of the vectors themselves, pairs and groups
+found, and how many planted duplicates ended up grouped with their source.
+
+Usage (from the embedding-model directory):
+    python eval/dedup_benchmark.py --sizes 10000,100000 --threshold 0.95 --output dedup.json
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from ann_benchmark import synthetic_vectors
+from common import peak_rss_mb
+from dedup import duplicate_groups, minibatch_kmeans
+
+
+def planted(n: int, dimension: int, share: float, noise: float, rng):
+    """n vectors of which `share` are noisy copies; returns (vectors, (copy, source) pairs)."""
+    copies = int(n * share)
+    vectors = synthetic_vectors(n, dimension, rng)
+    sources = rng.choice(n - copies, copies, replace=False)
+    targets = np.arange(n - copies, n)
+    jitter = rng.standard_normal((copies, dimension)).astype(np.float32) * noise
+    vectors[targets] = vectors[sources] + jitter
+    vectors[targets] /= np.linalg.norm(vectors[targets], axis=1, keepdims=True)
+    return vectors, np.stack([targets, sources], axis=1)
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate self-join and k-means runtime/memory")
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--block", type=int, default=2048)
+    parser.add_argument("--duplicate-share", type=float, default=0.02)
+    parser.add_argument("--noise", type=float, default=0.01, help="stddev of the noise added to copies")
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    results = []
+    for size in (int(v) for v in args.sizes.split(",")):
+        rng = np.random.default_rng(args.seed)
+        vectors, pairs_planted = planted(size, args.dimension, args.duplicate_share, args.noise, rng)
+
+        (groups, pairs), join_s, join_peak = measure(duplicate_groups, vectors, args.threshold, args.block)
+        group_of = np.full(size, -1)
+        for g, members in enumerate(groups):
+            group_of[members] = g
+        copies, sources = pairs_planted[:, 0], pairs_planted[:, 1]
+        found = float(np.mean((group_of[copies] >= 0) & (group_of[copies] == group_of[sources])))
+
+        (_, labels), kmeans_s, kmeans_peak = measure(minibatch_kmeans, vectors, args.k)
+
+        results.append({
+            "size": size,
+            "vectors_mb": round(vectors.nbytes / mb, 1),
+            "self_join": {
+                "seconds": round(join_s, 2),
+                "peak_alloc_mb": round(join_peak / mb, 1),
+                "pairs": pairs,
+                "groups": len(groups),
+                "planted_found": round(found, 4),
+            },
+            "kmeans": {
+                "seconds": round(kmeans_s, 2),
+                "peak_alloc_mb": round(kmeans_peak / mb, 1),
+                "k": args.k,
+                "largest_cluster": int(np.bincount(labels).max()),
+            },
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        })
+
+    print("=" * 72)
+    print(f"DEDUP threshold={args.threshold} block={args.block}, {args.duplicate_share:.0%} planted copies")
+    print("=" * 72)
+    for r in results:
+        j, c = r["self_join"], r["kmeans"]
+        print(f"n={r['size']:,} ({r['vectors_mb']} MB of vectors), peak RSS {r['peak_rss_mb']} MB")
+        print(f"  self-join: {j['seconds']} s, peak alloc {j['peak_alloc_mb']} MB, {j['pairs']} pairs,"
+              f" {j['groups']} groups, planted found {j['planted_found']:.2%}")
+        print(f"  k-means:   {c['seconds']} s, peak alloc {c['peak_alloc_mb']} MB, k={c['k']},"
+              f" largest cluster {c['largest_cluster']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Engine Benchmark - IndonesianEmbeddingEngine latency/throughput sweep
+Sweeps model variant x intra-op threads (one child process each, so peak RSS
+belongs to a single configuration) and, inside each process, batch size x
+text length. Every point is warmed up first, then timed over --iterations
+calls of engine.embed_array with the embedding cache disabled.
+
+Reports p50/p95/p99 latency, sentences/sec, peak RSS and Python/NumPy
+allocations (tracemalloc, measured in a separate untimed call). With
+--repeats N every configuration runs in N fresh processes, interleaved, and
+each point keeps the median plus every run's value. Results are written as
+JSON; `compare` diffs two result files and exits non-zero when a point got
+slower by more than the threshold, the run-to-run spread of either file and
+--min-delta-ms all at once.
+
+Usage (from the embedding-model directory):
+    python eval/engine_benchmark.py run --batch-sizes 1,8,32,64 --lengths 16,64,256 \\
+        --variants fp32,q8 --threads 1,2,4 --repeats 3 --output bench-before.json
+    python eval/engine_benchmark.py compare bench-before.json bench-after.json --threshold 0.1
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from common import MODEL_DIR, create_engine, load_eval_set, peak_rss_mb, percentiles
+
+
+def make_texts(engine, words, count: int, tokens: int):
+    """`count` distinct texts of about `tokens` tokens each (incl. special tokens)."""
+    texts = []
+    for i in range(count):
+        offset = (i * 7) % len(words)
+        text = " ".join((words[offset:] + words)[:tokens])
+        encoding = engine.tokenizer.encode(text)
+        content = [o for o, s in zip(encoding.offsets, encoding.special_tokens_mask) if not s]
+        texts.append(text[: content[min(tokens - 2, len(content)) - 1][1]])
+    return texts
+
+
+def _measure_config(variant: str, threads: int, args, words, conn):
+    """Runs in a child process: one engine, every (batch size, length) point."""
+    start = time.perf_counter()
+    engine = create_engine(variant, intra_op_threads=threads, max_batch_size=max(args.batch_sizes))
+    load_ms = (time.perf_counter() - start) * 1000
+
+    points = []
+    for tokens in args.lengths:
+        for batch_size in args.batch_sizes:
+            texts = make_texts(engine, words, batch_size, tokens)
+            mean_tokens = float(np.mean([len(e) for e in engine.tokenizer.encode_batch(texts)]))
+
+            for _ in range(args.warmup):
+                engine.embed_array(texts)
+
+            latencies = []
+            for _ in range(args.iterations):
+                begin = time.perf_counter()
+                engine.embed_array(texts)
+                latencies.append((time.perf_counter() - begin) * 1000)
+
+            tracemalloc.start()
+            engine.embed_array(texts)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            p50 = float(np.median(latencies))
+            points.append({
+                "variant": variant,
+                "threads": threads,
+                "batch_size": batch_size,
+                "tokens": tokens,
+                "mean_tokens": round(mean_tokens, 1),
+                "latency_ms": percentiles(latencies),
+                "sentences_per_s": round(batch_size / (p50 / 1000), 1),
+                "alloc_peak_mb": round(peak / (1024 * 1024), 2),
+            })
+
+    conn.send({
+        "variant": variant,
+        "threads": threads,
+        "load_ms": round(load_ms, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "points": points,
+    })
+    conn.close()
+
+
+def measure(variant: str, threads: int, args, words) -> dict:
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_measure_config, args=(variant, threads, args, words, child))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def environment() -> dict:
+    import onnxruntime
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=MODEL_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "onnxruntime": onnxruntime.__version__,
+    }
+
+
+def merge_repeats(results: list) -> dict:
+    """One configuration from its repeated runs: per point the median of each
+    latency percentile, with every run's value kept under "runs_ms"."""
+    merged = dict(results[0])
+    merged["repeats"] = len(results)
+    merged["load_ms"] = round(float(np.median([r["load_ms"] for r in results])), 1)
+    merged["peak_rss_mb"] = max(r["peak_rss_mb"] for r in results)
+    merged["points"] = []
+    for i, point in enumerate(results[0]["points"]):
+        runs = [r["points"][i] for r in results]
+        runs_ms = {name: [run["latency_ms"][name] for run in runs] for name in point["latency_ms"]}
+        latency = {name: round(float(np.median(values)), 3) for name, values in runs_ms.items()}
+        merged["points"].append({
+            **point,
+            "latency_ms": latency,
+            "runs_ms": runs_ms,
+            "sentences_per_s": round(point["batch_size"] / (latency["p50"] / 1000), 1),
+            "alloc_peak_mb": max(run["alloc_peak_mb"] for run in runs),
+        })
+    return merged
+
+
+def spread(point: dict, metric: str) -> float:
+    """Max - min of `metric` across the point's runs; 0 for single-run results."""
+    values = point.get("runs_ms", {}).get(metric)
+    return max(values) - min(values) if values else 0.0
+
+
+def point_key(point: dict) -> tuple:
+    return point["variant"], point["threads"], point["batch_size"], point["tokens"]
+
+
+def run(args):
+    eval_set = load_eval_set(args.eval_set)
+    words = " ".join(p["text"] for p in eval_set["passages"]).split()
+
+    # Repeats interleaved across configurations, so slow drift (thermal,
+    # other tenants) spreads over all of them instead of biasing one
+    runs = {}
+    for repeat in range(args.repeats):
+        for variant in args.variants:
+            for threads in args.threads:
+                runs.setdefault((variant, threads), []).append(measure(variant, threads, args, words))
+                print(f"run {repeat + 1}/{args.repeats}: {variant} threads={threads} done")
+
+    configs = []
+    for results in runs.values():
+        result = merge_repeats(results)
+        configs.append(result)
+
+        print("=" * 72)
+        print(f"{result['variant']} threads={result['threads']}: load {result['load_ms']} ms,"
+              f" peak RSS {result['peak_rss_mb']} MB, median of {result['repeats']} run(s)")
+        print(f"{'batch':>6} {'tokens':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sent/s':>9}"
+              f" {'alloc MB':>9} {'p50 spread':>11}")
+        for p in result["points"]:
+            lat = p["latency_ms"]
+            print(f"{p['batch_size']:>6} {p['mean_tokens']:>7} {lat['p50']:>9} {lat['p95']:>9}"
+                  f" {lat['p99']:>9} {p['sentences_per_s']:>9} {p['alloc_peak_mb']:>9}"
+                  f" {spread(p, 'p50'):>11.3f}")
+
+    report = {
+        "environment": environment(),
+        "params": {
+            "batch_sizes": args.batch_sizes,
+            "lengths": args.lengths,
+            "variants": args.variants,
+            "threads": args.threads,
+            "warmup": args.warmup,
+            "iterations": args.iterations,
+            "repeats": args.repeats,
+        },
+        "configs": configs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    base_points = {point_key(p): p for c in baseline["configs"] for p in c["points"]}
+    if any(c.get("repeats", 1) < 2 for c in baseline["configs"] + candidate["configs"]):
+        print("note: single-run results have no measured spread; only --threshold and"
+              " --min-delta-ms separate a regression from noise (run with --repeats 3)")
+
+    regressions = []
+    metric = args.metric
+    print(f"{'variant':>7} {'thr':>4} {'batch':>6} {'tokens':>7} {metric + ' base':>9} {metric + ' new':>9}"
+          f" {'change':>8} {'noise ms':>9}")
+    for config in candidate["configs"]:
+        for point in config["points"]:
+            base = base_points.get(point_key(point))
+            if base is None:
+                continue
+            before, after = base["latency_ms"][metric], point["latency_ms"][metric]
+            change = (after - before) / before if before else 0.0
+            # A slowdown counts only past the threshold, the run-to-run
+            # spread of either side and the absolute floor
+            noise = max(spread(base, metric), spread(point, metric))
+            flag = ""
+            if change > args.threshold and after - before > max(noise, args.min_delta_ms):
+                flag = "  REGRESSION"
+                regressions.append({"point": point_key(point), "before": before, "after": after})
+            print(f"{point['variant']:>7} {point['threads']:>4} {point['batch_size']:>6} {point['tokens']:>7}"
+                  f" {before:>9} {after:>9} {change:>+8.1%} {noise:>9.3f}{flag}")
+
+    for config in candidate["configs"]:
+        base = next((c for c in baseline["configs"]
+                     if (c["variant"], c["threads"]) == (config["variant"], config["threads"])), None)
+        if base:
+            print(f"{config['variant']} threads={config['threads']}: peak RSS"
+                  f" {base['peak_rss_mb']} -> {config['peak_rss_mb']} MB")
+
+    if regressions:
+        print(f"FAIL: {len(regressions)} point(s) slower than {args.threshold:.0%} on {metric},"
+              f" beyond the run-to-run spread and {args.min_delta_ms} ms")
+        sys.exit(1)
+    print("PASS")
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput sweep over IndonesianEmbeddingEngine")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the sweep")
+    run_parser.add_argument("--batch-sizes", type=int_list, default=[1, 8, 32, 64])
+    run_parser.add_argument("--lengths", type=int_list, default=[16, 64, 256],
+                            help="target text lengths in tokens")
+    run_parser.add_argument("--variants", type=lambda v: v.split(","), default=["fp32"])
+    run_parser.add_argument("--threads", type=int_list, default=[0],
+                            help="intra-op thread counts (0 = cgroup-aware auto)")
+    run_parser.add_argument("--warmup", type=int, default=3)
+    run_parser.add_argument("--iterations", type=int, default=30)
+    run_parser.add_argument("--repeats", type=int, default=3,
+                            help="fresh processes per configuration; compare uses their spread as noise")
+    run_parser.add_argument("--eval-set", default=None)
+    run_parser.add_argument("--output", default=None, help="write results as JSON")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--metric", default="p50", choices=["p50", "p95", "p99"])
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative latency increase that counts as a regression")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=0.25,
+                                help="absolute latency increase below which nothing counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Load Test - latency vs load for a running embedding service
+Drives a locally started main.py/serve.py with asyncio keep-alive HTTP/1.1
+clients (stdlib only) and steps the load up:
+
+    closed loop  --concurrency 1,2,4,8,16   N clients, each sends its next
+                                            request when the previous returns
+    open loop    --rates 5,10,20,40         Poisson arrivals at R requests/s,
+                                            whatever the latency
+
+Each step reports throughput, p50/p95/p99/p99.9 latency, error rate and
+status codes, and the run names the saturation point: the last step that
+still added throughput (closed) or kept up with the offered rate (open)
+within --slo-ms at p99.
+
+Requests are drawn from a weighted mix of PROFILES (short queries, bulk
+passages, search, rerank, similarity) over a text corpus, seeded so that
+two runs send the same sequence. --record saves the sequence as JSONL and
+--replay sends a saved one.
+
+Usage (from the embedding-model directory, service on :8000):
+    python eval/load_test.py --mode closed --concurrency 1,2,4,8,16,32 --mix query:0.8,bulk:0.2
+    python eval/load_test.py --mode open --rates 10,20,40,80 --duration 20 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from common import load_eval_set, percentiles
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+def _query(rng, corpus, args):
+    return "/embed", {"texts": [rng.choice(corpus["queries"])]}, 1
+
+
+def _bulk(rng, corpus, args):
+    return "/embed", {"texts": rng.choices(corpus["passages"], k=args.bulk_size)}, args.bulk_size
+
+
+def _search(rng, corpus, args):
+    return "/search", {"query": rng.choice(corpus["queries"]), "limit": 5}, 1
+
+
+def _rerank(rng, corpus, args):
+    texts = rng.choices(corpus["passages"], k=args.bulk_size)
+    return "/rerank", {"query": rng.choice(corpus["queries"]), "texts": texts, "topK": 5}, args.bulk_size + 1
+
+
+def _similarity(rng, corpus, args):
+    sources = rng.choices(corpus["queries"], k=4)
+    targets = rng.choices(corpus["passages"], k=args.bulk_size)
+    return "/similarity", {"sources": sources, "targets": targets}, args.bulk_size + 4
+
+
+# name -> builder(rng, corpus, args) returning (path, JSON body, texts sent)
+PROFILES = {
+    "query": _query,
+    "bulk": _bulk,
+    "search": _search,
+    "rerank": _rerank,
+    "similarity": _similarity,
+}
+
+
+def load_corpus(path: Optional[str]) -> dict:
+    """Queries and passages from a JSONL/text file, or the Indonesian eval set.
+
+    JSONL lines may be {"text": ..., "kind": "query"|"passage"}; plain lines
+    and lines without a kind serve as both.
+    """
+    if path is None:
+        eval_set = load_eval_set()
+        return {
+            "queries": [q["text"] for q in eval_set["queries"]],
+            "passages": [p["text"] for p in eval_set["passages"]],
+        }
+
+    corpus = {"queries": [], "passages": []}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            kind = None
+            if line.startswith("{"):
+                record = json.loads(line)
+                line, kind = record["text"], record.get("kind")
+            if kind in (None, "query"):
+                corpus["queries"].append(line)
+            if kind in (None, "passage"):
+                corpus["passages"].append(line)
+    if not corpus["queries"] or not corpus["passages"]:
+        raise ValueError(f"{path} has no queries or no passages")
+    return corpus
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in PROFILES:
+            raise ValueError(f"unknown profile {name!r}, expected one of {sorted(PROFILES)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class RequestSource:
+    """Seeded request sequence; identical across runs with the same arguments."""
+
+    def __init__(self, args, corpus: dict):
+        self.args = args
+        self.corpus = corpus
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.replay = None
+        if args.replay:
+            with open(args.replay, encoding="utf-8") as f:
+                self.replay = [json.loads(line) for line in f if line.strip()]
+        self.sent = 0
+        self.recorded = [] if args.record else None
+
+    def next(self) -> dict:
+        if self.replay is not None:
+            request = self.replay[self.sent % len(self.replay)]
+        else:
+            names, weights = zip(*self.mix)
+            profile = self.rng.choices(names, weights)[0]
+            path, body, texts = PROFILES[profile](self.rng, self.corpus, self.args)
+            if self.args.unique and "texts" in body:
+                # Defeat the embedding cache so every text reaches the model
+                body["texts"] = [f"{text} [{self.sent}.{i}]" for i, text in enumerate(body["texts"])]
+            request = {"profile": profile, "path": path, "body": body, "texts": texts}
+        self.sent += 1
+        if self.recorded is not None:
+            self.recorded.append(request)
+        return request
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection: POST JSON, read the whole response."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def post(self, path: str, payload: bytes, timeout: float) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n"
+        ).encode("ascii")
+        self.writer.write(head + payload)
+        return await asyncio.wait_for(self._read_response(), timeout)
+
+    async def _read_response(self) -> int:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                close = value == "close"
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Step:
+    def __init__(self, label: str, load: float):
+        self.label = label
+        self.load = load
+        self.latencies: List[float] = []
+        self.statuses = Counter()
+        self.texts = 0
+        self.sent = 0
+        self.dropped = 0
+
+    async def send(self, connection: Connection, request: dict, timeout: float):
+        payload = json.dumps(request["body"]).encode("utf-8")
+        self.sent += 1
+        start = time.perf_counter()
+        try:
+            status = await connection.post(request["path"], payload, timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            connection.close()
+            status = "error"
+        self.statuses[status] += 1
+        if status == 200:
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.texts += request["texts"]
+
+    def report(self, wall: float, duration: float) -> dict:
+        ok = len(self.latencies)
+        return {
+            "step": self.label,
+            "load": self.load,
+            "offered_per_s": round(self.sent / duration, 2),
+            "requests": self.sent,
+            "ok": ok,
+            "dropped": self.dropped,
+            "error_rate": round(1 - ok / self.sent, 4) if self.sent else 0.0,
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "requests_per_s": round(ok / wall, 2),
+            "texts_per_s": round(self.texts / wall, 1),
+            "latency_ms": percentiles(self.latencies, PERCENTILES),
+        }
+
+
+async def closed_loop(args, source: RequestSource, concurrency: int) -> dict:
+    step = Step(f"concurrency={concurrency}", concurrency)
+    stop_at = time.perf_counter() + args.duration
+
+    async def client():
+        connection = Connection(args.host, args.port)
+        while time.perf_counter() < stop_at:
+            await step.send(connection, source.next(), args.timeout)
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return step.report(time.perf_counter() - start, args.duration)
+
+
+async def open_loop(args, source: RequestSource, rate: float) -> dict:
+    """Poisson arrivals at `rate`/s; arrivals beyond --max-outstanding are dropped."""
+    step = Step(f"rate={rate:g}/s", rate)
+    idle: List[Connection] = []
+    tasks = set()
+    arrivals = random.Random(args.seed)
+
+    async def one(request):
+        connection = idle.pop() if idle else Connection(args.host, args.port)
+        await step.send(connection, request, args.timeout)
+        idle.append(connection)
+
+    start = time.perf_counter()
+    next_at = start
+    while next_at < start + args.duration:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= args.max_outstanding:
+            step.dropped += 1
+            step.sent += 1
+            step.statuses["dropped"] += 1
+        else:
+            task = asyncio.ensure_future(one(source.next()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        next_at += arrivals.expovariate(rate)
+    if tasks:
+        await asyncio.gather(*tasks)
+    report = step.report(time.perf_counter() - start, args.duration)
+    for connection in idle:
+        connection.close()
+    return report
+
+
+def saturation(steps: List[dict], mode: str, slo_ms: float, gain: float) -> dict:
+    """The knee: the last step before throughput stops growing or p99 breaks the SLO."""
+    knee, reason = None, "not reached"
+    for i, step in enumerate(steps):
+        p99 = step["latency_ms"]["p99"]
+        if step["ok"] == 0 or p99 is None or p99 > slo_ms:
+            reason = f"p99 above {slo_ms} ms at {step['step']}"
+            break
+        if mode == "open" and step["ok"] < step["requests"] * (1 - gain):
+            reason = f"throughput fell behind the offered rate at {step['step']}"
+            break
+        if mode == "closed" and i and step["requests_per_s"] < steps[i - 1]["requests_per_s"] * (1 + gain):
+            reason = f"throughput stopped growing at {step['step']}"
+            break
+        knee = step
+    return {
+        "step": knee["step"] if knee else None,
+        "requests_per_s": knee["requests_per_s"] if knee else None,
+        "p99_ms": knee["latency_ms"]["p99"] if knee else None,
+        "reason": reason,
+    }
+
+
+async def run(args) -> dict:
+    source = RequestSource(args, load_corpus(args.corpus))
+    loads = args.concurrency if args.mode == "closed" else args.rates
+    steps = []
+    for value in (float(v) for v in loads.split(",")):
+        if args.warmup:
+            await closed_loop(argparse.Namespace(**{**vars(args), "duration": args.warmup}), source, 1)
+        if args.mode == "closed":
+            report = await closed_loop(args, source, int(value))
+        else:
+            report = await open_loop(args, source, value)
+        steps.append(report)
+        latency = report["latency_ms"]
+        print(f"{report['step']:>18}: {report['requests_per_s']:>8} req/s {report['texts_per_s']:>9} texts/s"
+              f" | p50 {latency['p50']} p95 {latency['p95']} p99 {latency['p99']} p99.9 {latency['p99_9']} ms"
+              f" | errors {report['error_rate']:.2%} {report['statuses']}")
+
+    if source.recorded is not None:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for request in source.recorded:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    knee = saturation(steps, args.mode, args.slo_ms, args.gain)
+    print(f"saturation: {knee['step']} ({knee['requests_per_s']} req/s, p99 {knee['p99_ms']} ms); {knee['reason']}")
+    return {"params": vars(args), "steps": steps, "saturation": knee}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open/closed-loop load generator for the embedding service")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="closed-loop client counts")
+    parser.add_argument("--rates", default="5,10,20,40,80", help="open-loop arrival rates (requests/s)")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per step")
+    parser.add_argument("--warmup", type=float, default=0.0, help="seconds of one client before each step")
+    parser.add_argument("--mix", default="query:0.8,bulk:0.2", help=f"profile:weight from {sorted(PROFILES)}")
+    parser.add_argument("--bulk-size", type=int, default=32, help="texts per bulk/rerank/similarity request")
+    parser.add_argument("--corpus", default=None, help="JSONL/text file of texts (default: the eval set)")
+    parser.add_argument("--unique", action="store_true", help="make every text unique to bypass the cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", default=None, help="save the sent request sequence as JSONL")
+    parser.add_argument("--replay", default=None, help="send a recorded request sequence instead of the mix")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-outstanding", type=int, default=256, help="open loop: in-flight cap")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 latency bound for the knee")
+    parser.add_argument("--gain", type=float, default=0.05,
+                        help="closed: minimum throughput growth per step; open: tolerated shortfall")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    args.host, args.port = url.hostname, url.port or 80
+    parse_mix(args.mix)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+PQ Benchmark - product-quantized index vs uncompressed float32 search
+Trains a ProductQuantizer on synthetic clustered 384-d vectors and reports
+memory per vector, ADC scan throughput and recall@k with and without the
+exact re-rank stage, against an uncompressed brute-force baseline.
+
+Usage (from the embedding-model directory):
+    python eval/pq_benchmark.py --size 100000 --m 48 --rerank 0,32,64,128
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from ann_benchmark import exact_top_k, synthetic_vectors
+from common import percentiles
+from pq_index import PQIndex, ProductQuantizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product quantization memory/throughput/recall benchmark")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--m", type=int, default=48, help="sub-quantizers (bytes per vector)")
+    parser.add_argument("--nbits", type=int, default=8)
+    parser.add_argument("--train-iters", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", default="0,32,64,128", help="re-rank depths to compare (0 = ADC only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_vectors(args.size, args.dimension, rng)
+    queries = vectors[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.1
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    # Uncompressed baseline: one matmul over the whole float32 matrix
+    baseline_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        scores = vectors @ query
+        np.argpartition(-scores, args.k - 1)[: args.k]
+        baseline_ms.append((time.perf_counter() - start) * 1000)
+
+    quantizer = ProductQuantizer(args.dimension, args.m, args.nbits)
+    start = time.perf_counter()
+    quantizer.train(vectors, iters=args.train_iters, seed=args.seed)
+    train_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = PQIndex(quantizer, directory)
+        start = time.perf_counter()
+        index.add(vectors, [str(i) for i in range(args.size)])
+        encode_s = time.perf_counter() - start
+
+        scan_ms = []
+        for query in queries:
+            start = time.perf_counter()
+            index.scan(query)
+            scan_ms.append((time.perf_counter() - start) * 1000)
+
+        runs = []
+        for depth in (int(v) for v in args.rerank.split(",")):
+            latencies, recall = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                labels, _ = index.search(query, args.k, rerank=depth)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recall.append(len({int(l) for l in labels} & set(expected.tolist())) / args.k)
+            runs.append({
+                "rerank": depth,
+                f"recall_at_{args.k}": round(float(np.mean(recall)), 4),
+                "latency_ms": percentiles(latencies),
+            })
+
+        memory = index.memory_bytes()
+
+    report = {
+        "params": vars(args),
+        "train_s": round(train_s, 2),
+        "encode_s": round(encode_s, 2),
+        "memory": {
+            **memory,
+            "compression": round(memory["float32_bytes_per_vector"] / memory["bytes_per_vector"], 1),
+        },
+        "baseline": {
+            "latency_ms": percentiles(baseline_ms),
+            "vectors_per_s": round(args.size / (np.median(baseline_ms) / 1000)),
+        },
+        "adc_scan": {
+            "latency_ms": percentiles(scan_ms),
+            "vectors_per_s": round(args.size / (np.median(scan_ms) / 1000)),
+        },
+        "search": runs,
+    }
+
+    print("=" * 60)
+    print(f"PQ m={args.m} nbits={args.nbits} n={args.size:,}: train {report['train_s']} s, encode {report['encode_s']} s")
+    print(f"memory: {memory['bytes_per_vector']} B/vector vs {memory['float32_bytes_per_vector']} B float32"
+          f" ({report['memory']['compression']}x smaller)")
+    print(f"uncompressed scan: p50 {report['baseline']['latency_ms']['p50']} ms"
+          f" ({report['baseline']['vectors_per_s']:,} vectors/s)")
+    print(f"ADC scan:          p50 {report['adc_scan']['latency_ms']['p50']} ms"
+          f" ({report['adc_scan']['vectors_per_s']:,} vectors/s)")
+    for run in runs:
+        print(f"  rerank={run['rerank']:<4} recall@{args.k} {run[f'recall_at_{args.k}']:.4f}"
+              f"  p50 {run['latency_ms']['p50']} ms  p95 {run['latency_ms']['p95']} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
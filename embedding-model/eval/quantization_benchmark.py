@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Quantization Benchmark - retrieval quality and cost of compact embeddings
+Embeds the Indonesian evaluation set once, then scores the queries against
+the passages stored as float32, float16, per-vector int8, sign-bit binary
+(Hamming order) and binary prefilter + int8 re-score, each at several
+truncated dimensions. Reports recall@k against the labelled passages,
+top-k overlap with full float32 search, bytes per vector, and scan time
+per query over a synthetic corpus of --scan-size vectors.
+
+Usage (from the embedding-model directory):
+    python eval/quantization_benchmark.py --variant fp32 --dimensions 384,256,128 --output quant.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_benchmark import synthetic_vectors
+from common import create_engine, load_eval_set, percentiles, top_k
+from quantization import CompactIndex, bytes_per_vector, dequantize_int8, quantize_int8, truncate
+
+FORMS = ("float32", "float16", "int8", "binary", "binary+int8")
+
+
+def score(form: str, queries: np.ndarray, passages: np.ndarray, k: int, candidates: int) -> np.ndarray:
+    """Top-k passage indices per query with passages stored in `form`."""
+    if form == "float32":
+        return top_k(queries @ passages.T, k)
+    if form == "float16":
+        return top_k(queries @ passages.astype(np.float16).astype(np.float32).T, k)
+    if form == "int8":
+        return top_k(queries @ dequantize_int8(*quantize_int8(passages)).T, k)
+
+    index = CompactIndex(passages)
+    if form == "binary":
+        return np.stack([index.search(q, k, candidates=len(index), rescore=None)[0] for q in queries])
+    return np.stack([index.search(q, k, candidates=candidates, rescore="int8")[0] for q in queries])
+
+
+def scan_ms(form: str, corpus: np.ndarray, queries: np.ndarray, k: int, candidates: int) -> list:
+    """Per-query latency of one full scan over `corpus` in `form`.
+
+    NumPy has no float16/int8 matrix-vector kernels, so those forms are
+    widened to float32 per scan; their timings include that conversion.
+    """
+    if form in ("float32", "float16"):
+        stored = corpus.astype(form)
+        def run(q):
+            scores = stored.astype(np.float32, copy=False) @ q
+            return np.argpartition(-scores, k - 1)[:k]
+    elif form == "int8":
+        codes, scales = quantize_int8(corpus)
+        def run(q):
+            scores = (codes.astype(np.float32) @ q) * scales
+            return np.argpartition(-scores, k - 1)[:k]
+    else:
+        index = CompactIndex(corpus)
+        rescore = None if form == "binary" else "int8"
+        depth = k if form == "binary" else candidates
+        def run(q):
+            return index.search(q, k, candidates=depth, rescore=rescore)
+
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        run(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval loss and cost of compact embedding formats")
+    parser.add_argument("--variant", default="fp32")
+    parser.add_argument("--dimensions", default="384,256,128,64", help="truncated dimensions to compare")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=10,
+                        help="Hamming prefilter survivors re-scored with int8 (eval set)")
+    parser.add_argument("--scan-size", type=int, default=100000, help="synthetic corpus for scan timing")
+    parser.add_argument("--scan-candidates", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=50)
+    parser.add_argument("--eval-set", default=None)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    eval_set = load_eval_set(args.eval_set)
+    passages = [p["text"] for p in eval_set["passages"]]
+    ids = [p["id"] for p in eval_set["passages"]]
+    engine = create_engine(args.variant)
+    vectors = engine.embed_array(passages + [q["text"] for q in eval_set["queries"]])
+    passage_vectors, query_vectors = vectors[:len(passages)], vectors[len(passages):]
+    full_dimension = vectors.shape[1]
+    reference = top_k(query_vectors @ passage_vectors.T, args.k)
+
+    rng = np.random.default_rng(0)
+    scan_corpus = synthetic_vectors(args.scan_size, full_dimension, rng)
+    scan_queries = scan_corpus[rng.choice(args.scan_size, args.scan_queries, replace=False)]
+
+    results = []
+    for dimension in (int(v) for v in args.dimensions.split(",")):
+        queries = truncate(query_vectors, dimension)
+        stored = truncate(passage_vectors, dimension)
+        corpus = truncate(scan_corpus, dimension)
+        probes = truncate(scan_queries, dimension)
+        for form in FORMS:
+            top = score(form, queries, stored, args.k, args.candidates)
+            hits = [bool(set(q["relevant"]) & {ids[i] for i in row}) for q, row in zip(eval_set["queries"], top)]
+            overlap = [len(set(a.tolist()) & set(b.tolist())) / args.k for a, b in zip(top, reference)]
+            # Bytes scanned per vector: binary+int8 reads int8 codes only for the survivors
+            size = bytes_per_vector(form.split("+")[0], dimension)
+            results.append({
+                "dimension": dimension,
+                "form": form,
+                "bytes_per_vector": size,
+                "compression": round(bytes_per_vector("float32", full_dimension) / size, 1),
+                f"recall_at_{args.k}": round(float(np.mean(hits)), 4),
+                "top_k_overlap_vs_float32": round(float(np.mean(overlap)), 4),
+                "scan_latency_ms": percentiles(scan_ms(form, corpus, probes, args.k, args.scan_candidates)),
+            })
+
+    print("=" * 78)
+    print(f"COMPACT EMBEDDINGS ({args.variant}, {len(passages)} passages, {len(query_vectors)} queries,"
+          f" scan over {args.scan_size:,} vectors)")
+    print("=" * 78)
+    print(f"{'dim':>4} {'form':<12} {'B/vec':>6} {'x':>6} {f'R@{args.k}':>6} {'overlap':>8} {'scan p50 ms':>12}")
+    for r in results:
+        print(f"{r['dimension']:>4} {r['form']:<12} {r['bytes_per_vector']:>6} {r['compression']:>6}"
+              f" {r[f'recall_at_{args.k}']:>6} {r['top_k_overlap_vs_float32']:>8} {r['scan_latency_ms']['p50']:>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Model Variant Gate - Indonesian Embedding Model
+Compares a candidate ONNX variant (q8 by default) against the fp32 baseline
+on the fixed Indonesian evaluation set and fails when quality drifts.
+
+Usage (from the embedding-model directory):
+    python eval/variant_gate.py --candidate q8 --min-cosine 0.98 --min-overlap 0.8
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+
+import numpy as np
+
+from common import create_engine, load_eval_set, peak_rss_mb, percentiles, top_k
+
+
+def _measure_variant(variant: str, texts, queries, runs: int, conn):
+    """Runs in a child process so RSS and load time belong to one variant."""
+    start = time.perf_counter()
+    engine = create_engine(variant)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    vectors = engine.embed_array(texts)
+
+    # Warmup, then single-query latency (the chatbot path)
+    for query in queries[:3]:
+        engine.embed_array([query])
+    query_ms = []
+    for _ in range(runs):
+        for query in queries:
+            start = time.perf_counter()
+            engine.embed_array([query])
+            query_ms.append((time.perf_counter() - start) * 1000)
+
+    conn.send({
+        "variant": variant,
+        "load_ms": round(load_ms, 1),
+        "query_latency_ms": percentiles(query_ms, (50, 95)),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "vectors": vectors,
+    })
+    conn.close()
+
+
+def measure(variant: str, texts, queries, runs: int) -> dict:
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_measure_variant, args=(variant, texts, queries, runs, child))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def retrieval(query_vectors, passage_vectors, k: int) -> np.ndarray:
+    return top_k(query_vectors @ passage_vectors.T, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy/latency gate between model variants")
+    parser.add_argument("--baseline", default="fp32")
+    parser.add_argument("--candidate", default="q8")
+    parser.add_argument("--k", type=int, default=5, help="top-k used for retrieval overlap")
+    parser.add_argument("--runs", type=int, default=20, help="latency passes over the query set")
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="minimum per-text cosine between baseline and candidate vectors")
+    parser.add_argument("--min-overlap", type=float, default=0.8,
+                        help="minimum mean top-k overlap between baseline and candidate retrieval")
+    parser.add_argument("--eval-set", default=None)
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    eval_set = load_eval_set(args.eval_set)
+    passages = [p["text"] for p in eval_set["passages"]]
+    queries = [q["text"] for q in eval_set["queries"]]
+    texts = passages + queries
+
+    results = {v: measure(v, texts, queries, args.runs) for v in (args.baseline, args.candidate)}
+    base = results[args.baseline].pop("vectors")
+    cand = results[args.candidate].pop("vectors")
+
+    cosine = np.sum(base * cand, axis=1)
+
+    n = len(passages)
+    base_top = retrieval(base[n:], base[:n], args.k)
+    cand_top = retrieval(cand[n:], cand[:n], args.k)
+    overlap = np.array([
+        len(set(b.tolist()) & set(c.tolist())) / base_top.shape[1]
+        for b, c in zip(base_top, cand_top)
+    ])
+
+    ids = [p["id"] for p in eval_set["passages"]]
+    recall = {}
+    for variant, top in ((args.baseline, base_top), (args.candidate, cand_top)):
+        hits = [
+            bool(set(q["relevant"]) & {ids[i] for i in row})
+            for q, row in zip(eval_set["queries"], top)
+        ]
+        recall[variant] = round(float(np.mean(hits)), 4)
+
+    report = {
+        "baseline": results[args.baseline],
+        "candidate": results[args.candidate],
+        "cosine": {
+            "mean": round(float(cosine.mean()), 5),
+            "min": round(float(cosine.min()), 5),
+        },
+        "top_k": args.k,
+        "top_k_overlap": {
+            "mean": round(float(overlap.mean()), 4),
+            "min": round(float(overlap.min()), 4),
+        },
+        f"recall_at_{args.k}": recall,
+        "thresholds": {"min_cosine": args.min_cosine, "min_overlap": args.min_overlap},
+    }
+
+    failures = []
+    if report["cosine"]["min"] < args.min_cosine:
+        failures.append(f"min cosine {report['cosine']['min']} < {args.min_cosine}")
+    if report["top_k_overlap"]["mean"] < args.min_overlap:
+        failures.append(f"mean top-{args.k} overlap {report['top_k_overlap']['mean']} < {args.min_overlap}")
+    report["passed"] = not failures
+    report["failures"] = failures
+
+    print("=" * 60)
+    print(f"VARIANT GATE: {args.candidate} vs {args.baseline}")
+    print("=" * 60)
+    for role in ("baseline", "candidate"):
+        r = report[role]
+        print(f"{r['variant']:>6}: load {r['load_ms']} ms | query p50 {r['query_latency_ms']['p50']} ms"
+              f" p95 {r['query_latency_ms']['p95']} ms | peak RSS {r['peak_rss_mb']} MB")
+    print(f"cosine agreement: mean {report['cosine']['mean']} min {report['cosine']['min']}")
+    print(f"top-{args.k} overlap: mean {report['top_k_overlap']['mean']} min {report['top_k_overlap']['min']}")
+    print(f"recall@{args.k}: {recall}")
+    print("PASS" if report["passed"] else "FAIL: " + "; ".join(failures))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Worker Scaling - throughput and memory of serve.py per worker count
+Starts the service with each --workers value, drives POST /embed with a
+closed loop of keep-alive clients for --duration seconds, then reads every
+worker's memory from /proc: RSS split into private (anon) and file-backed
+pages, and PSS, whose sum over workers is the real total when the model
+pages are shared.
+
+Usage (from the embedding-model directory; export shared weights first):
+    python export_shared_weights.py onnx/indonesian_embedding.onnx
+    python eval/worker_scaling.py --workers 1,2,4 --duration 20 --output scaling.json
+"""
+
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from common import MODEL_DIR, load_eval_set, percentiles
+from workers import memory_status
+
+
+def get(port: int, path: str):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        conn.close()
+
+
+def wait_ready(port: int, workers: int, timeout: float) -> set:
+    """Poll /ready until `workers` distinct worker pids have answered 200."""
+    pids = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and len(pids) < workers:
+        try:
+            status, body = get(port, "/ready")
+            if status == 200:
+                pids.add(body["worker"])
+        except (OSError, http.client.HTTPException, ValueError):
+            pass
+        time.sleep(0.05)
+    if len(pids) < workers:
+        raise RuntimeError(f"only {len(pids)}/{workers} workers ready after {timeout}s")
+    return pids
+
+
+def drive(port: int, texts, batch: int, clients: int, duration: float) -> dict:
+    latencies, errors, counter = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(seed: int):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        i = seed
+        while time.monotonic() < stop_at:
+            # Unique texts so the embedding cache does not answer for the model
+            body = json.dumps({"texts": [f"{texts[(i + j) % len(texts)]} {i}-{j}" for j in range(batch)]})
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/embed", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+                counter[0] += 1
+            i += clients
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": counter[0],
+        "errors": errors[0],
+        "requests_per_s": round(len(latencies) / wall, 1),
+        "texts_per_s": round(len(latencies) * batch / wall, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def run(workers: int, args, texts) -> dict:
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port), "--host", "127.0.0.1"],
+        cwd=MODEL_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        pids = wait_ready(args.port, workers, args.ready_timeout)
+        load = drive(args.port, texts, args.batch, args.clients_per_worker * workers, args.duration)
+        memory = {pid: memory_status(str(pid)) for pid in sorted(pids)}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    mb = 1024 * 1024
+    totals = {
+        kind: round(sum(m.get(kind, 0) for m in memory.values()) / mb, 1)
+        for kind in ("rss", "rss_anon", "rss_file", "pss")
+    }
+    return {
+        "workers": workers,
+        **load,
+        "memory_mb_total": totals,
+        "memory_mb_per_worker": {
+            str(pid): {kind: round(value / mb, 1) for kind, value in m.items()} for pid, m in memory.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory per worker count")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--batch", type=int, default=8, help="texts per request")
+    parser.add_argument("--clients-per-worker", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--eval-set", default=None)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    eval_set = load_eval_set(args.eval_set)
+    texts = [p["text"] for p in eval_set["passages"]] + [q["text"] for q in eval_set["queries"]]
+
+    results = []
+    for workers in (int(v) for v in args.workers.split(",")):
+        result = run(workers, args, texts)
+        results.append(result)
+        total = result["memory_mb_total"]
+        print(f"workers={workers}: {result['texts_per_s']} texts/s, p50 {result['latency_ms']['p50']} ms"
+              f" p99 {result['latency_ms']['p99']} ms, errors {result['errors']} | memory total:"
+              f" RSS {total['rss']} MB (anon {total['rss_anon']}, file {total['rss_file']}), PSS {total['pss']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Export an ONNX model for shared-weight serving (see shared_weights.py).
+
+Writes next to the model:
+    <name>.shared.onnx   graph whose large initializers point at the .bin file
+    <name>.shared.bin    raw little-endian weights, each tensor 64-byte aligned
+    <name>.shared.json   manifest: name, dtype, shape and offset per tensor
+
+Run once per shipped variant (needs the `onnx` package, which the service
+itself does not), and for the <name>_fused.onnx files from
+build_fused_model.py: the engine loads the fused file when it exists, and
+the shared weights are looked up next to the file actually loaded:
+    python export_shared_weights.py onnx/indonesian_embedding.onnx
+    python export_shared_weights.py onnx/indonesian_embedding_q8.onnx
+    python export_shared_weights.py onnx/indonesian_embedding_fused.onnx
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import onnx
+from onnx import numpy_helper
+from onnx.external_data_helper import set_external_data
+
+from shared_weights import ALIGNMENT, shared_paths
+
+
+def export(model_path: str, min_bytes: int = 1024) -> dict:
+    graph_path, weights_path, manifest_path = shared_paths(model_path)
+    model = onnx.load(model_path)
+
+    tensors = []
+    offset = 0
+    with open(weights_path, "wb") as f:
+        for tensor in model.graph.initializer:
+            array = numpy_helper.to_array(tensor)
+            if array.nbytes < min_bytes or array.dtype == object:
+                continue
+
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+
+            data = np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"), copy=False)
+            f.write(data.tobytes())
+            tensors.append({
+                "name": tensor.name,
+                "dtype": data.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            })
+
+            # Keep the graph loadable on its own: the tensor now lives in the .bin
+            for field in ("float_data", "int32_data", "int64_data", "double_data", "uint64_data"):
+                tensor.ClearField(field)
+            tensor.raw_data = b"\0"  # set_external_data insists on a raw_data field
+            set_external_data(tensor, os.path.basename(weights_path), offset, data.nbytes)
+            tensor.ClearField("raw_data")
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            offset += data.nbytes
+
+    onnx.save(model, graph_path)
+    manifest = {
+        "source": os.path.basename(model_path),
+        "graph": os.path.basename(graph_path),
+        "weights": os.path.basename(weights_path),
+        "bytes": offset,
+        "tensors": tensors,
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split ONNX weights into a memory-mappable file")
+    parser.add_argument("models", nargs="+")
+    parser.add_argument("--min-bytes", type=int, default=1024,
+                        help="initializers smaller than this stay inside the graph")
+    args = parser.parse_args()
+
+    for model_path in args.models:
+        manifest = export(model_path, args.min_bytes)
+        print(f"{model_path}: {len(manifest['tensors'])} tensors,"
+              f" {manifest['bytes'] / (1024 * 1024):.1f} MB -> {manifest['weights']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph over L2-normalized vectors.
+
+    Similarity is the inner product, which equals cosine for the engine's
+    normalized outputs. Inserts are incremental; deletes only tombstone a
+    node, which keeps routing through it but drops it from results.
+
+    `M` bounds the links per node on the upper layers (2*M on layer 0),
+    `ef_construction` is the beam width while inserting and `ef_search`
+    the default beam width while querying (higher = better recall, slower).
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        M: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 64,
+        capacity: int = 1024,
+        seed: int = 42,
+    ):
+        self.dimension = dimension
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1 / math.log(M)
+        self._rng = np.random.default_rng(seed)
+
+        capacity = max(capacity, 1)
+        self.vectors = np.empty((capacity, dimension), dtype=np.float32)
+        self.levels = np.zeros(capacity, dtype=np.int8)
+        self.deleted = np.zeros(capacity, dtype=bool)
+        self.links0 = np.full((capacity, self.M0), -1, dtype=np.int32)
+        self.counts0 = np.zeros(capacity, dtype=np.int16)
+        self.upper: List[Dict[int, np.ndarray]] = []
+
+        self.labels: List[str] = []
+        self.label_to_node: Dict[str, int] = {}
+        self.entry_point = -1
+        self.max_level = -1
+        self.size = 0
+
+        self._visited = np.zeros(capacity, dtype=np.uint32)
+        self._tag = 0
+
+    def __len__(self) -> int:
+        return len(self.label_to_node)
+
+    # ── storage ──────────────────────────────────────────────────────────────
+    def _grow(self, needed: int):
+        capacity = self.vectors.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+
+        def resized(array, fill):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            return grown
+
+        self.vectors = resized(self.vectors, 0)
+        self.levels = resized(self.levels, 0)
+        self.deleted = resized(self.deleted, False)
+        self.links0 = resized(self.links0, -1)
+        self.counts0 = resized(self.counts0, 0)
+        self._visited = np.zeros(capacity, dtype=np.uint32)
+        self._tag = 0
+
+    def _neighbors(self, node: int, level: int) -> np.ndarray:
+        if level == 0:
+            return self.links0[node, : self.counts0[node]]
+        return self.upper[level - 1].get(node, _EMPTY)
+
+    def _set_neighbors(self, node: int, level: int, neighbors):
+        neighbors = np.asarray(neighbors, dtype=np.int32)
+        if level == 0:
+            self.links0[node, : len(neighbors)] = neighbors
+            self.counts0[node] = len(neighbors)
+        else:
+            self.upper[level - 1][node] = neighbors
+
+    # ── graph search ─────────────────────────────────────────────────────────
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int):
+        """Beam search on one layer; returns up to ef (similarity, node) pairs."""
+        self._tag += 1
+        if self._tag == np.iinfo(np.uint32).max:
+            self._visited[:] = 0
+            self._tag = 1
+        tag, visited, vectors = self._tag, self._visited, self.vectors
+
+        entry = np.asarray(entry_points, dtype=np.int32)
+        visited[entry] = tag
+        sims = (vectors[entry] @ query).tolist()
+
+        candidates = [(-s, n) for s, n in zip(sims, entry.tolist())]
+        heapq.heapify(candidates)
+        results = [(s, n) for s, n in zip(sims, entry.tolist())]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+
+            neighbors = self._neighbors(node, level)
+            neighbors = neighbors[visited[neighbors] != tag]
+            if len(neighbors) == 0:
+                continue
+            visited[neighbors] = tag
+
+            sims = vectors[neighbors] @ query
+            if len(results) >= ef:
+                better = sims > results[0][0]
+                neighbors, sims = neighbors[better], sims[better]
+
+            for sim, neighbor in zip(sims.tolist(), neighbors.tolist()):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return results
+
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """Diversity heuristic: keep a candidate only if it is closer to the
+        query than to every neighbor already kept, then top up with the best
+        of the rest."""
+        candidates = sorted(candidates, reverse=True)
+        if len(candidates) <= m:
+            return [n for _, n in candidates]
+
+        nodes = np.array([n for _, n in candidates], dtype=np.int32)
+        sims = [s for s, _ in candidates]
+        pairwise = self.vectors[nodes] @ self.vectors[nodes].T
+
+        # closest[i] = highest similarity of candidate i to any kept neighbor
+        closest = np.full(len(nodes), -np.inf, dtype=np.float32)
+        selected = []
+        for i in range(len(nodes)):
+            if sims[i] > closest[i]:
+                selected.append(i)
+                if len(selected) == m:
+                    break
+                np.maximum(closest, pairwise[i], out=closest)
+        if len(selected) < m:
+            chosen = set(selected)
+            selected.extend([i for i in range(len(nodes)) if i not in chosen][: m - len(selected)])
+        return nodes[selected].tolist()
+
+    def _descend(self, query: np.ndarray, to_level: int) -> List[int]:
+        entry = [self.entry_point]
+        for level in range(self.max_level, to_level, -1):
+            entry = [max(self._search_layer(query, entry, 1, level))[1]]
+        return entry
+
+    # ── public API ───────────────────────────────────────────────────────────
+    def add(self, vectors: np.ndarray, labels: List[str]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._grow(self.size + len(labels))
+        for vector, label in zip(vectors, labels):
+            self._insert(vector, label)
+
+    def _insert(self, vector: np.ndarray, label: str):
+        if label in self.label_to_node:
+            self.delete([label])
+
+        node = self.size
+        self.size += 1
+        self.vectors[node] = vector
+        level = int(-math.log(max(self._rng.random(), 1e-12)) * self._level_mult)
+        self.levels[node] = level
+        while len(self.upper) < level:
+            self.upper.append({})
+        self.labels.append(label)
+        self.label_to_node[label] = node
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry = self._descend(vector, level)
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(vector, entry, self.ef_construction, layer)
+            limit = self.M0 if layer == 0 else self.M
+            neighbors = self._select_neighbors(found, self.M)
+            self._set_neighbors(node, layer, neighbors)
+
+            for neighbor in neighbors:
+                links = np.append(self._neighbors(neighbor, layer), node)
+                if len(links) > limit:
+                    sims = (self.vectors[links] @ self.vectors[neighbor]).tolist()
+                    links = self._select_neighbors(list(zip(sims, links.tolist())), limit)
+                self._set_neighbors(neighbor, layer, links)
+
+            entry = [n for _, n in found]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def delete(self, labels: List[str]) -> int:
+        deleted = 0
+        for label in labels:
+            node = self.label_to_node.pop(label, None)
+            if node is not None:
+                self.deleted[node] = True
+                deleted += 1
+        return deleted
+
+    def search(self, query: np.ndarray, k: int = 10, ef: Optional[int] = None):
+        """Approximate top-k (labels, similarities), best first."""
+        if not self.label_to_node:
+            return [], np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        found = self._search_layer(query, self._descend(query, 0), max(ef or self.ef_search, k), 0)
+        found = sorted(((s, n) for s, n in found if not self.deleted[n]), reverse=True)[:k]
+        return [self.labels[n] for _, n in found], np.array([s for s, _ in found], dtype=np.float32)
+
+    def snapshot(self) -> dict:
+        return {
+            "live": len(self),
+            "nodes": self.size,
+            "tombstones": self.size - len(self),
+            "max_level": self.max_level,
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+        }
+
+    # ── persistence ──────────────────────────────────────────────────────────
+    def save(self, path: str):
+        nodes, levels, offsets, flat = [], [], [0], []
+        for level, layer in enumerate(self.upper, start=1):
+            for node, links in layer.items():
+                nodes.append(node)
+                levels.append(level)
+                flat.append(links)
+                offsets.append(offsets[-1] + len(links))
+
+        n = self.size
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                params=np.array([
+                    self.dimension, self.M, self.ef_construction, self.ef_search,
+                    self.entry_point, self.max_level,
+                ], dtype=np.int64),
+                vectors=self.vectors[:n],
+                levels=self.levels[:n],
+                deleted=self.deleted[:n],
+                links0=self.links0[:n],
+                counts0=self.counts0[:n],
+                upper_nodes=np.array(nodes, dtype=np.int32),
+                upper_levels=np.array(levels, dtype=np.int32),
+                upper_offsets=np.array(offsets, dtype=np.int64),
+                upper_links=np.concatenate(flat) if flat else _EMPTY,
+                labels=np.array(self.labels, dtype=str),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "HNSWIndex":
+        with np.load(path, allow_pickle=False) as data:
+            dimension, M, ef_construction, ef_search, entry_point, max_level = data["params"].tolist()
+            n = len(data["levels"])
+            index = cls(dimension, M, ef_construction, ef_search, capacity=max(n, 1))
+            index.size = n
+            index.vectors[:n] = data["vectors"]
+            index.levels[:n] = data["levels"]
+            index.deleted[:n] = data["deleted"]
+            index.links0[:n] = data["links0"]
+            index.counts0[:n] = data["counts0"]
+
+            index.upper = [{} for _ in range(max(max_level, 0))]
+            offsets = data["upper_offsets"]
+            links = data["upper_links"]
+            for i, (node, level) in enumerate(zip(data["upper_nodes"].tolist(), data["upper_levels"].tolist())):
+                index.upper[level - 1][node] = links[offsets[i]: offsets[i + 1]].copy()
+
+            index.labels = data["labels"].tolist()
+            index.label_to_node = {
+                label: node for node, label in enumerate(index.labels) if not index.deleted[node]
+            }
+            index.entry_point, index.max_level = entry_point, max_level
+        return index
+
+
+def build_file(vectors_path: str, ids_path: str, output_path: str, **params) -> HNSWIndex:
+    """Build a graph over a .npy matrix and its JSON list of labels and save it to `output_path`."""
+    vectors = np.load(vectors_path, mmap_mode="r")
+    with open(ids_path, encoding="utf-8") as f:
+        labels = json.load(f)
+    index = HNSWIndex(vectors.shape[1], capacity=len(labels), **params)
+    index.add(vectors, labels)
+    index.save(output_path)
+    return index
+
+
+def main():
+    # The build is pure Python: VectorIndex runs it through this entry point
+    # in a child process, and it can also be run offline over a table's
+    # snapshot (<table>.npy, <table>.ids.json -> <table>.hnsw.npz)
+    parser = argparse.ArgumentParser(description="Build an HNSW graph over saved vectors")
+    parser.add_argument("vectors", help=".npy float32 matrix")
+    parser.add_argument("ids", help="JSON list with one label per row")
+    parser.add_argument("output", help=".npz graph to write")
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--nice", type=int, default=0, help="lower the build's CPU priority by this much")
+    args = parser.parse_args()
+
+    if args.nice:
+        os.nice(args.nice)
+    start = time.perf_counter()
+    index = build_file(args.vectors, args.ids, args.output,
+                       M=args.M, ef_construction=args.ef_construction, ef_search=args.ef_search)
+    print(f"{args.vectors}: {len(index)} vectors -> {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
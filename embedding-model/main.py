@@ -1,17 +1,242 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Cold-start clock: the "imports" phase is everything up to the engine build
+STARTED = time.perf_counter()
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from embedding_engine import IndonesianEmbeddingEngine
-from typing import List
+from embedding_engine import DEFAULT_VARIANT, IndonesianEmbeddingEngine
+from session_config import SessionConfig
+from batcher import MicroBatcher, Overloaded
+from streaming import EmbedStreamEndpoint
+from vector_index import VectorIndex
+from metrics import Histogram, Registry, Sampled
+from workers import WorkerSlot, memory_status
+from typing import List, Literal, Optional
+import metrics
+import dedup
+import profiler
+import quantization
+import response_encoding
+import shared_weights
+import asyncio
+import hmac
+import logging
+import numpy as np
 import os
-import time
 
-app = FastAPI(title="Indonesian Embedding Service")
+IMPORTS_MS = (time.perf_counter() - STARTED) * 1000
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("embedding-service")
+
+# Under serve.py (EMBED_WORKERS > 1) each worker takes a slot and is pinned to
+# its share of the CPUs before the sessions size their thread pools
+WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+worker = WorkerSlot(WORKERS, pin=WORKERS > 1 and os.getenv("EMBED_PIN_WORKERS", "1") == "1")
+
+# MODEL_PATH overrides the file picked by MODEL_VARIANT (fp32 or q8)
+model_path = os.getenv("MODEL_PATH")
+
+# ONNX Runtime tuning from ORT_SESSION_CONFIG / ORT_* (see session_config.py).
+# Threads default to the cgroup-aware core count split between pooled sessions.
+session_config = SessionConfig.from_env(defaults={"optimized_model_dir": "./onnx/optimized"})
+pool_size = int(os.getenv("EMBED_POOL_SIZE", "1"))
+intra_op_threads = int(os.getenv("EMBED_INTRA_OP_THREADS", "0"))
+
+# Sequence lengths x batch sizes run on every session before /ready says yes
+# (EMBED_WARMUP_LENGTHS="" skips warmup)
+WARMUP_LENGTHS = [int(v) for v in os.getenv("EMBED_WARMUP_LENGTHS", "16,64,128,384").split(",") if v]
+WARMUP_BATCH_SIZES = [int(v) for v in os.getenv("EMBED_WARMUP_BATCH_SIZES", "1,16").split(",") if v]
+
+executor = ThreadPoolExecutor(max_workers=max(1, pool_size), thread_name_prefix="embed")
+# Vector index reads and journal writes: off the event loop, and never queued
+# behind inference
+index_executor = ThreadPoolExecutor(
+    max_workers=max(1, int(os.getenv("VECTOR_INDEX_THREADS", "2"))), thread_name_prefix="index"
+)
+# Table-wide analysis (duplicate self-join, k-means) can take a minute on a
+# large table: one call at a time, on its own thread
+analysis_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+
+# Built in the background by load_service(); handlers answer 503 until then
+engine: Optional[IndonesianEmbeddingEngine] = None
+batcher: Optional[MicroBatcher] = None
+vector_index: Optional[VectorIndex] = None
+MODEL_NAME = "asmud/indonesian-embedding-small (onnx)"
+# /similarity answers with a full score matrix; cap its size
+SIMILARITY_MAX_PAIRS = int(os.getenv("SIMILARITY_MAX_PAIRS", "250000"))
+# /index/duplicates: thresholds below the minimum, or more pairs than the
+# cap, would make the union-find pass over O(n^2) pairs
+DUPLICATES_MIN_THRESHOLD = float(os.getenv("DUPLICATES_MIN_THRESHOLD", "0.8"))
+DUPLICATES_MAX_PAIRS = int(os.getenv("DUPLICATES_MAX_PAIRS", "1000000"))
+# /debug/profile only exists when ADMIN_TOKEN is set; one capture at a time
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+profile_lock = asyncio.Lock()
+startup = {"status": "loading", "phases_ms": {"imports": round(IMPORTS_MS, 1)}, "error": None}
+
+def build_engine() -> IndonesianEmbeddingEngine:
+    built = IndonesianEmbeddingEngine(
+        model_path=model_path,
+        pool_size=pool_size,
+        intra_op_threads=intra_op_threads,
+        session_config=session_config,
+        cache_size=int(os.getenv("EMBED_CACHE_SIZE", "4096")),
+        # Padded tokens per session.run: bounds activation and output memory
+        max_batch_tokens=int(os.getenv("EMBED_MAX_BATCH_TOKENS", "16384")),
+        chunk_overlap=int(os.getenv("EMBED_CHUNK_OVERLAP", "64")),
+        io_binding=os.getenv("EMBED_IO_BINDING", "1") == "1",
+        verify_fused=os.getenv("EMBED_VERIFY_FUSED", "0") == "1",
+    )
+    if WARMUP_LENGTHS:
+        built.warmup(WARMUP_LENGTHS, WARMUP_BATCH_SIZES)
+    return built
 
-model_path = os.getenv("MODEL_PATH", "./onnx/indonesian_embedding.onnx")
-engine = IndonesianEmbeddingEngine(model_path=model_path)
+def build_vector_index(dimension: int) -> Optional[VectorIndex]:
+    # The index lives in process memory and owns its files: with several
+    # workers each would hold and persist a different part of it
+    if WORKERS > 1:
+        logger.warning("Vector index disabled: it needs a single worker (EMBED_WORKERS=%d)", WORKERS)
+        return None
+    # Tables with at least VECTOR_INDEX_ANN_MIN_ROWS rows are searched through an
+    # HNSW graph instead of an exact scan (0 keeps every table exact). Below
+    # ~10-20k rows the exact scan is faster (eval/README.md, ann_benchmark.py)
+    return VectorIndex(
+        dimension,
+        os.getenv("VECTOR_INDEX_DIR", "./index"),
+        ann_min_rows=int(os.getenv("VECTOR_INDEX_ANN_MIN_ROWS", "50000")),
+        ann_ef=int(os.getenv("VECTOR_INDEX_ANN_EF", "16")),
+        ann_params={
+            "M": int(os.getenv("VECTOR_INDEX_ANN_M", "16")),
+            "ef_construction": int(os.getenv("VECTOR_INDEX_ANN_EF_CONSTRUCTION", "100")),
+        },
+    )
+
+# Service-level gauges; the engine's stage timers are added once it is loaded
+registry = Registry()
+request_seconds = registry.add(Histogram(
+    "embedding_request_seconds", "End-to-end handler time per endpoint",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0), label="endpoint",
+))
+registry.add(Sampled("embedding_ready", "1 once the model is loaded and warmed up",
+                     lambda: int(startup["status"] == "ready")))
+registry.add(Sampled("embedding_startup_phase_seconds", "Cold-start time per phase",
+                     lambda: {k: v / 1000 for k, v in startup["phases_ms"].items()}, label="phase"))
+registry.add(Sampled("embedding_worker_memory_bytes", "This worker's memory (rss, rss_anon, rss_file, pss)",
+                     memory_status, label="kind"))
+
+def register_engine_metrics():
+    registry.add(engine.metrics)
+    registry.add(batcher.stats.wait_seconds)
+    registry.add(Sampled("embedding_queue_depth", "Requests waiting for a batch per priority class",
+                         batcher.queue_depths, label="priority"))
+    registry.add(Sampled("embedding_rejected_total", "Requests refused because their class's queue was full",
+                         lambda: {name: lane.rejected for name, lane in batcher.lanes.items()},
+                         kind="counter", label="priority"))
+    registry.add(Sampled("embedding_batches_in_flight", "Batches currently running", lambda: batcher.in_flight))
+    registry.add(Sampled("embedding_sessions_in_use", "ONNX sessions currently running",
+                         lambda: engine.pool.snapshot()["in_use"]))
+    registry.add(Sampled("embedding_sessions", "ONNX sessions in the pool", lambda: engine.pool.size))
+    registry.add(Sampled("embedding_requests_total", "Requests dispatched through the batcher",
+                         lambda: batcher.stats.requests, kind="counter"))
+    registry.add(Sampled("embedding_texts_total", "Texts dispatched through the batcher",
+                         lambda: batcher.stats.texts, kind="counter"))
+    if engine.cache is not None:
+        registry.add(Sampled("embedding_cache_lookups_total", "Embedding cache lookups by result",
+                             lambda: {"hit": engine.cache.hits, "miss": engine.cache.misses},
+                             kind="counter", label="result"))
+
+async def load_service():
+    """Load tokenizer, sessions and index off the event loop, warm up, then go ready."""
+    global engine, batcher, vector_index, MODEL_NAME
+    loop = asyncio.get_running_loop()
+    try:
+        built = await loop.run_in_executor(executor, build_engine)
+        start = time.perf_counter()
+        index = await loop.run_in_executor(executor, build_vector_index, built.dimension)
+        index_ms = (time.perf_counter() - start) * 1000
+    except Exception as exc:
+        startup["status"], startup["error"] = "failed", f"{type(exc).__name__}: {exc}"
+        logger.exception("Model loading failed")
+        return
+
+    if built.variant != DEFAULT_VARIANT:
+        MODEL_NAME = f"asmud/indonesian-embedding-small (onnx {built.variant})"
+    engine, vector_index = built, index
+    batcher = MicroBatcher(
+        engine,
+        max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "3")),
+        max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "64")),
+        max_batch_tokens=int(os.getenv("BATCH_MAX_TOKENS", "8192")),
+        executor=executor,
+        concurrency=engine.pool.size,
+        # Admission control: interactive (<= BATCH_INTERACTIVE_MAX_TEXTS texts,
+        # unless the request asks for bulk) preempts bulk between chunks
+        bulk_concurrency=int(os.getenv("BATCH_BULK_CONCURRENCY", "1")),
+        interactive_queue_limit=int(os.getenv("BATCH_INTERACTIVE_QUEUE_LIMIT", "256")),
+        bulk_queue_limit=int(os.getenv("BATCH_BULK_QUEUE_LIMIT", "16")),
+        interactive_max_texts=int(os.getenv("BATCH_INTERACTIVE_MAX_TEXTS", "4")),
+        bulk_chunk=int(os.getenv("BATCH_BULK_CHUNK", "64")),
+    )
+    batcher.start()
+    register_engine_metrics()
+
+    phases = startup["phases_ms"]
+    phases.update({name: round(ms, 1) for name, ms in engine.load_timings.items()})
+    phases["index"] = round(index_ms, 1)
+    phases["total"] = round((time.perf_counter() - STARTED) * 1000, 1)
+    startup["status"] = "ready"
+    if engine.fused and not engine.pool.shared and shared_weights.available(engine.base_model_path):
+        logger.warning(
+            "%s has no shared-weight export, so this worker holds private weights;"
+            " run export_shared_weights.py on it too", engine.model_path,
+        )
+    logger.info(
+        "Worker %d/%d ready (%s, %d session(s) x %d thread(s), %s weights, %s pooling): %s",
+        (worker.index or 0) + 1, WORKERS, engine.variant, engine.pool.size, engine.pool.intra_op_threads,
+        "shared" if engine.pool.shared else "private", "fused" if engine.fused else "numpy",
+        ", ".join(f"{name} {ms} ms" for name, ms in phases.items()),
+    )
+
+def require_ready():
+    if engine is None:
+        raise HTTPException(status_code=503, detail="model is still loading", headers={"Retry-After": "5"})
+
+def require_index():
+    if vector_index is None:
+        raise HTTPException(status_code=501, detail="the vector index needs a single worker (EMBED_WORKERS=1)")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bind right away; loading finishes in the background and flips /ready
+    loader = asyncio.create_task(load_service())
+    yield
+    loader.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    executor.shutdown(wait=False)
+    index_executor.shutdown(wait=False)
+    analysis_executor.shutdown(wait=False)
+
+app = FastAPI(title="Indonesian Embedding Service", lifespan=lifespan)
+ready = [Depends(require_ready)]
+indexed = [Depends(require_ready), Depends(require_index)]
 
 class EmbedRequest(BaseModel):
     texts: List[str]
+    # Only used for non-default encodings; plain JSON is always float lists
+    encoding_format: Literal["float", "base64"] = "float"
+    # int8: per-vector scaled codes (x ~= code * scale); binary: sign bits, 8 per byte
+    dtype: Literal["float32", "float16", "int8", "binary"] = "float32"
+    # Keep the leading N dimensions (re-normalized)
+    dimensions: Optional[int] = None
+    # Admission class; by default small requests are interactive, large ones bulk.
+    # Asking for interactive does not lift the BATCH_INTERACTIVE_MAX_TEXTS limit
+    priority: Optional[Literal["interactive", "bulk"]] = None
 
 class EmbedResponse(BaseModel):
     embeddings: List[List[float]]
@@ -19,24 +244,461 @@ class EmbedResponse(BaseModel):
     model: str
     elapsed_ms: float
 
-@app.post("/embed", response_model=EmbedResponse)
-def embed(req: EmbedRequest):
+def encode_embeddings(data, scales, dimension: int, media_type: str, req: EmbedRequest, elapsed: float):
+    """Build a binary or base64 response straight from the NumPy buffer."""
+    meta = {
+        "dimension": dimension,
+        "model": MODEL_NAME,
+        "elapsed_ms": round(elapsed, 2),
+    }
+
+    if media_type == response_encoding.MEDIA_JSON:
+        body = {
+            "embeddings": response_encoding.encode_base64(data),
+            "encoding_format": "base64",
+            "dtype": req.dtype,
+            "shape": list(data.shape),
+            **meta,
+        }
+        if scales is not None:
+            body["scales"] = response_encoding.encode_base64(scales)
+        return JSONResponse(body)
+
+    if media_type == response_encoding.MEDIA_MSGPACK:
+        if scales is not None:
+            meta["scales"] = scales.tobytes()
+        try:
+            body = response_encoding.encode_msgpack(data, meta)
+        except ImportError:
+            raise HTTPException(status_code=406, detail="msgpack encoding not available")
+    elif media_type == response_encoding.MEDIA_NPY:
+        if scales is not None:
+            raise HTTPException(status_code=406, detail="int8 needs its scales: use octet-stream or msgpack")
+        body = response_encoding.encode_npy(data)
+    else:
+        # int8: the float32 scales follow the codes
+        body = data.tobytes() if scales is None else data.tobytes() + scales.tobytes()
+
+    headers = {
+        "X-Embedding-Shape": f"{data.shape[0]},{data.shape[1]}",
+        "X-Embedding-Dtype": req.dtype,
+        "X-Embedding-Dimension": str(dimension),
+        "X-Model": MODEL_NAME,
+        "X-Elapsed-Ms": str(meta["elapsed_ms"]),
+    }
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@app.post("/embed", response_model=EmbedResponse, dependencies=ready)
+async def embed(req: EmbedRequest, request: Request):
     if not req.texts or len(req.texts) == 0:
         raise HTTPException(status_code=400, detail="texts required")
-    
-    start = time.time()
+    if req.dimensions is not None and not 0 < req.dimensions <= engine.dimension:
+        raise HTTPException(status_code=400, detail=f"dimensions must be between 1 and {engine.dimension}")
+
+    media_type = response_encoding.negotiate(request.headers.get("accept"))
+    packed = media_type != response_encoding.MEDIA_JSON or req.encoding_format == "base64"
+    if req.dtype == "float16" and not packed:
+        # JSON numbers have no half precision
+        raise HTTPException(
+            status_code=400,
+            detail="dtype float16 needs encoding_format=base64 or a binary Accept type",
+        )
+
+    start = time.perf_counter()
+
+    vectors = await submit(req.texts, req.priority)
+
+    encode_start = time.perf_counter()
+    elapsed = (encode_start - start) * 1000
+
+    dimension = req.dimensions or vectors.shape[1]
+    if packed:
+        data, scales = quantization.compact(vectors, req.dtype, req.dimensions)
+        response = encode_embeddings(data, scales, dimension, media_type, req, elapsed)
+    elif req.dtype in ("int8", "binary"):
+        data, scales = quantization.compact(vectors, req.dtype, req.dimensions)
+        body = {
+            "embeddings": data.tolist(),
+            "dtype": req.dtype,
+            "dimension": dimension,
+            "model": MODEL_NAME,
+            "elapsed_ms": round(elapsed, 2),
+        }
+        if scales is not None:
+            body["scales"] = scales.tolist()
+        response = JSONResponse(body)
+    else:
+        vectors = quantization.truncate(vectors, req.dimensions)
+        response = JSONResponse({
+            "embeddings": vectors.tolist(),
+            "dimension": dimension,
+            "model": MODEL_NAME,
+            "elapsed_ms": round(elapsed, 2),
+        })
+
+    done = time.perf_counter()
+    engine.stage_seconds.observe(done - encode_start, "serialize")
+    request_seconds.observe(done - start, "embed")
+    return response
+
+# Raw ASGI route: it reads the request body while already streaming results
+app.add_route(
+    "/embed/stream",
+    EmbedStreamEndpoint(
+        lambda: engine,
+        lambda: batcher,
+        batch_size=int(os.getenv("EMBED_STREAM_BATCH_SIZE", "64")),
+    ),
+    methods=["POST"],
+)
+
+class ChunkRequest(BaseModel):
+    texts: List[str]
+    # True: one pooled vector per text; False: every chunk with its offsets
+    pooled: bool = False
+
+class IndexItem(BaseModel):
+    rowId: str
+    text: Optional[str] = None
+    # Precomputed vector from this model, e.g. when restoring from Mongo
+    vector: Optional[List[float]] = None
+
+class IndexUpsertRequest(BaseModel):
+    tableName: str
+    items: List[IndexItem]
+
+class IndexDeleteRequest(BaseModel):
+    tableName: str
+    rowIds: List[str]
+
+class SearchRequest(BaseModel):
+    query: str
+    tableName: List[str] = []
+    limit: int = 5
+    minScore: float = 0.3
+
+class SimilarityRequest(BaseModel):
+    sources: List[str]
+    targets: List[str]
+
+class RerankRequest(BaseModel):
+    query: str
+    # Candidates as texts, or as rowIds already in the index under tableName
+    texts: Optional[List[str]] = None
+    tableName: Optional[str] = None
+    rowIds: Optional[List[str]] = None
+    topK: int = 10
+    minScore: Optional[float] = None
+
+class DuplicatesRequest(BaseModel):
+    tableName: str
+    threshold: float = 0.95
+
+class ClustersRequest(BaseModel):
+    tableName: str
+    k: int = 20
+
+async def run_in_index(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(index_executor, func, *args)
+
+async def run_in_analysis(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(analysis_executor, func, *args)
 
-    embeddings = engine.embed(req.texts)
+def overloaded(exc: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=exc.status,
+        detail=f"{exc.priority} queue is full, retry later",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
-    elapsed = (time.time() - start) * 1000
+async def submit(texts: List[str], priority: Optional[str] = None) -> np.ndarray:
+    """Embed through the batcher; a full queue answers at once with Retry-After."""
+    try:
+        return await batcher.submit(texts, priority)
+    except Overloaded as exc:
+        raise overloaded(exc)
+
+async def run_bulk(func, texts: List[str]) -> list:
+    """Run an engine call over slices of texts as bulk batcher work."""
+    try:
+        return await batcher.run_bulk(func, texts)
+    except Overloaded as exc:
+        raise overloaded(exc)
+
+@app.post("/embed/chunks", dependencies=ready)
+async def embed_chunks(req: ChunkRequest):
+    """Embed texts longer than the model window as overlapping chunks."""
+    if not req.texts:
+        raise HTTPException(status_code=400, detail="texts required")
+
+    start = time.perf_counter()
+
+    if req.pooled:
+        vectors = np.concatenate(await run_bulk(engine.embed_documents, req.texts))
+        return {
+            "embeddings": vectors.tolist(),
+            "dimension": vectors.shape[1],
+            "model": MODEL_NAME,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    parts = await run_bulk(engine.embed_chunks, req.texts)
+    vectors = np.concatenate([part[0] for part in parts])
+    # Document indices are per slice; shift them back to request positions
+    documents = np.concatenate([part[1] + i * batcher.bulk_chunk for i, part in enumerate(parts)])
+    offsets = np.concatenate([part[2] for part in parts])
+    chunks = [[] for _ in req.texts]
+    for doc, (begin, end), vector in zip(documents.tolist(), offsets.tolist(), vectors.tolist()):
+        chunks[doc].append({"start": begin, "end": end, "embedding": vector})
 
     return {
-        "embeddings": embeddings,
-        "dimension": len(embeddings[0]),
-        "model": "asmud/indonesian-embedding-small (onnx)",
-        "elapsed_ms": round(elapsed, 2),
+        "documents": [{"chunks": doc_chunks} for doc_chunks in chunks],
+        "dimension": vectors.shape[1],
+        "model": MODEL_NAME,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+@app.post("/index/upsert", dependencies=indexed)
+async def index_upsert(req: IndexUpsertRequest):
+    if not req.items:
+        raise HTTPException(status_code=400, detail="items required")
+    if any((item.text is None) == (item.vector is None) for item in req.items):
+        raise HTTPException(status_code=400, detail="each item needs exactly one of text or vector")
+
+    start = time.perf_counter()
+
+    vectors = np.empty((len(req.items), engine.dimension), dtype=np.float32)
+    to_embed = [i for i, item in enumerate(req.items) if item.text is not None]
+    try:
+        for i, item in enumerate(req.items):
+            if item.vector is not None:
+                vectors[i] = item.vector
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"vectors must have dimension {engine.dimension}")
+    if to_embed:
+        vectors[to_embed] = await submit([req.items[i].text for i in to_embed], "bulk")
+
+    row_ids = [item.rowId for item in req.items]
+    try:
+        await run_in_index(vector_index.upsert, req.tableName, row_ids, vectors)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return {
+        "tableName": req.tableName,
+        "upserted": len(row_ids),
+        "embedded": len(to_embed),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+@app.post("/index/delete", dependencies=indexed)
+async def index_delete(req: IndexDeleteRequest):
+    try:
+        deleted = await run_in_index(vector_index.delete, req.tableName, req.rowIds)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"tableName": req.tableName, "deleted": deleted}
+
+@app.post("/search", dependencies=indexed)
+async def search(req: SearchRequest):
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="query required")
+    if req.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    start = time.perf_counter()
+
+    query_vector = (await submit([req.query], "interactive"))[0]
+    matches = await run_in_index(vector_index.search, query_vector, req.tableName, req.limit, req.minScore)
+
+    elapsed = time.perf_counter() - start
+    request_seconds.observe(elapsed, "search")
+    return {
+        "matches": matches,
+        "elapsed_ms": round(elapsed * 1000, 2),
+    }
+
+@app.post("/index/duplicates", dependencies=indexed)
+async def index_duplicates(req: DuplicatesRequest):
+    """Groups of rows whose vectors are at least `threshold` similar."""
+    if not DUPLICATES_MIN_THRESHOLD <= req.threshold <= 1.0:
+        raise HTTPException(status_code=400, detail=f"threshold must be between {DUPLICATES_MIN_THRESHOLD:g} and 1")
+    start = time.perf_counter()
+    try:
+        vectors, row_ids = await run_in_index(vector_index.table, req.tableName)
+        groups, pairs = await run_in_analysis(
+            dedup.duplicate_groups, vectors, req.threshold, 2048, DUPLICATES_MAX_PAIRS
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {
+        "tableName": req.tableName,
+        "rows": len(row_ids),
+        "pairs": pairs,
+        "groups": [[row_ids[i] for i in group] for group in groups],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+@app.post("/index/clusters", dependencies=indexed)
+async def index_clusters(req: ClustersRequest):
+    """Mini-batch k-means topic clusters of a table, largest first."""
+    if req.k < 1:
+        raise HTTPException(status_code=400, detail="k must be positive")
+    start = time.perf_counter()
+    try:
+        vectors, row_ids = await run_in_index(vector_index.table, req.tableName)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    clusters = []
+    if row_ids:
+        _, labels = await run_in_analysis(dedup.minibatch_kmeans, vectors, req.k)
+        members = {}
+        for row_id, label in zip(row_ids, labels.tolist()):
+            members.setdefault(label, []).append(row_id)
+        clusters = sorted(members.values(), key=len, reverse=True)
+    return {
+        "tableName": req.tableName,
+        "rows": len(row_ids),
+        "clusters": clusters,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
     }
 
+def top_k(scores: np.ndarray, k: int, min_score: Optional[float]) -> np.ndarray:
+    """Indices of the k best scores (at least min_score), best first."""
+    candidates = np.arange(len(scores)) if min_score is None else np.flatnonzero(scores >= min_score)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+@app.post("/similarity", dependencies=ready)
+async def similarity(req: SimilarityRequest):
+    """Cosine score matrix [len(sources), len(targets)] from one embedding batch."""
+    if not req.sources or not req.targets:
+        raise HTTPException(status_code=400, detail="sources and targets required")
+    if len(req.sources) * len(req.targets) > SIMILARITY_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"at most {SIMILARITY_MAX_PAIRS} pairs per request")
+
+    start = time.perf_counter()
+
+    vectors = await submit(req.sources + req.targets)
+    scores = vectors[:len(req.sources)] @ vectors[len(req.sources):].T
+
+    elapsed = time.perf_counter() - start
+    request_seconds.observe(elapsed, "similarity")
+    return JSONResponse({
+        "scores": scores.tolist(),
+        "shape": list(scores.shape),
+        "model": MODEL_NAME,
+        "elapsed_ms": round(elapsed * 1000, 2),
+    })
+
+@app.post("/rerank", dependencies=ready)
+async def rerank(req: RerankRequest):
+    """Top-k candidates for a query, by cosine similarity."""
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="query required")
+    if (req.texts is None) == (req.rowIds is None):
+        raise HTTPException(status_code=400, detail="give exactly one of texts or rowIds")
+    if req.rowIds is not None and not req.tableName:
+        raise HTTPException(status_code=400, detail="rowIds need a tableName")
+    if req.topK < 1:
+        raise HTTPException(status_code=400, detail="topK must be positive")
+
+    start = time.perf_counter()
+
+    missing = []
+    if req.texts is not None:
+        # Query and candidates share one batch
+        vectors = await submit([req.query] + req.texts)
+        query_vector, candidates = vectors[0], vectors[1:]
+    else:
+        require_index()
+        try:
+            candidates, found = await run_in_index(vector_index.get, req.tableName, req.rowIds)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        query_vector = (await submit([req.query], "interactive"))[0]
+        present = set(found)
+        missing = [row_id for row_id in req.rowIds if row_id not in present]
+
+    scores = candidates @ query_vector
+    best = top_k(scores, req.topK, req.minScore)
+    if req.texts is not None:
+        results = [{"index": int(i), "similarity": float(scores[i])} for i in best]
+    else:
+        results = [
+            {"rowId": found[i], "tableName": req.tableName, "similarity": float(scores[i])}
+            for i in best
+        ]
+
+    elapsed = time.perf_counter() - start
+    request_seconds.observe(elapsed, "rerank")
+    return {
+        "results": results,
+        "missing": missing,
+        "elapsed_ms": round(elapsed * 1000, 2),
+    }
+
+@app.get("/stats", dependencies=ready)
+def stats():
+    return {
+        "batcher": batcher.snapshot(),
+        "pool": engine.pool.snapshot(),
+        "session_config": session_config.snapshot(),
+        "pooling": {"fused": engine.fused, "fused_max_diff": engine.fused_max_diff},
+        "io_binding": engine.io_binding,
+        "max_batch_tokens": engine.max_batch_tokens,
+        "cache": engine.cache.snapshot() if engine.cache is not None else None,
+        "index": vector_index.snapshot() if vector_index is not None else None,
+        "startup_ms": startup["phases_ms"],
+        "worker": worker.snapshot(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+@app.get("/debug/profile", dependencies=[Depends(require_admin), *ready])
+async def debug_profile(seconds: float = 5.0, top: int = 20):
+    """ORT per-operator profile plus sampled Python stacks of the next `seconds`,
+    as a Chrome trace with a top-N hot-spot "summary" (see profiler.py)."""
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="a profile is already running")
+    async with profile_lock:
+        # Default executor: the embed threads keep serving while this one waits
+        trace = await asyncio.get_running_loop().run_in_executor(
+            None, profiler.capture, engine.pool, seconds, max(1, top)
+        )
+    logger.info("Profiled %.1f s: %d trace events", seconds, len(trace["traceEvents"]))
+    return JSONResponse(trace)
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    """Liveness: the process is up. Fails only when loading the model failed."""
+    if startup["status"] == "failed":
+        return JSONResponse({"status": "failed", "error": startup["error"]}, status_code=503)
+    body = {"status": "ok", "ready": engine is not None}
+    if engine is not None:
+        pool = engine.pool.snapshot()
+        body["variant"] = engine.variant
+        body["pool"] = {"size": pool["size"], "in_use": pool["in_use"]}
+    return body
+
+@app.get("/ready")
+def ready_check():
+    """Readiness: 200 only once the model is loaded and warmed up."""
+    if startup["status"] != "ready":
+        return JSONResponse(
+            {"status": startup["status"], "error": startup["error"]},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+    return {"status": "ready", "worker": os.getpid(), "startup_ms": startup["phases_ms"]}
@@ -0,0 +1,104 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(pairs: Dict[str, str]) -> str:
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in pairs.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by one label.
+
+    `observe` is a bisect plus three additions under a lock, cheap enough
+    to call per batch on the inference path.
+    """
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.label = label
+        self._series: Dict[Optional[str], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: Optional[str] = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items(), key=lambda item: str(item[0])):
+            base = {self.label: label_value} if self.label else {}
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels({**base, 'le': _format(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(base)} {_format(total)}")
+            lines.append(f"{self.name}_count{_labels(base)} {count}")
+        return lines
+
+
+class Sampled:
+    """Gauge or counter whose value is read from a callback at scrape time.
+
+    The callback returns a number, or a {label value: number} dict when
+    `label` is set.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable, kind: str = "gauge", label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.read()
+        if self.label:
+            for label_value, v in sorted(value.items()):
+                lines.append(f"{self.name}{_labels({self.label: label_value})} {_format(v)}")
+        else:
+            lines.append(f"{self.name} {_format(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def lines(self) -> List[str]:
+        lines = []
+        for metric in self._metrics:
+            # Registries nest, e.g. the engine's own metrics inside the service's
+            lines.extend(metric.lines() if isinstance(metric, Registry) else metric.render())
+        return lines
+
+    def render(self) -> str:
+        return "\n".join(self.lines()) + "\n"
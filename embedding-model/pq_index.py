@@ -0,0 +1,190 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+
+def kmeans(data: np.ndarray, k: int, iters: int = 20, rng=None) -> np.ndarray:
+    """Plain Lloyd's k-means (squared L2), returns [k, dim] float32 centroids."""
+    rng = rng if rng is not None else np.random.default_rng(0)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=len(data) < k)].copy()
+
+    for _ in range(iters):
+        # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c)
+        labels = np.argmin((centroids ** 2).sum(axis=1) - 2 * data @ centroids.T, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        for j in range(data.shape[1]):
+            centroids[:, j] = np.bincount(labels, weights=data[:, j], minlength=k)
+        empty = counts == 0
+        centroids[~empty] /= counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+class ProductQuantizer:
+    """Splits vectors into `m` sub-vectors and codes each with a 2**nbits
+    entry codebook, so a 384-d float32 vector (1536 bytes) becomes m bytes."""
+
+    def __init__(self, dimension: int = 384, m: int = 48, nbits: int = 8):
+        if dimension % m:
+            raise ValueError(f"dimension {dimension} is not divisible by m={m}")
+        if nbits > 8:
+            raise ValueError("nbits above 8 is not supported (codes are uint8)")
+        self.dimension = dimension
+        self.m = m
+        self.ksub = 2 ** nbits
+        self.dsub = dimension // m
+        self.codebooks: Optional[np.ndarray] = None  # [m, ksub, dsub]
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.m, self.dsub)
+
+    def train(self, vectors: np.ndarray, iters: int = 20, sample: int = 65536, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample:
+            vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+        parts = self._split(vectors)
+        self.codebooks = np.stack([
+            kmeans(parts[:, j], self.ksub, iters, rng) for j in range(self.m)
+        ])
+
+    def encode(self, vectors: np.ndarray, block: int = 65536) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        norms = (self.codebooks ** 2).sum(axis=2)  # [m, ksub]
+        for start in range(0, len(vectors), block):
+            parts = self._split(vectors[start:start + block])
+            for j in range(self.m):
+                dist = norms[j] - 2 * parts[:, j] @ self.codebooks[j].T
+                codes[start:start + len(parts), j] = np.argmin(dist, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.m), codes]  # [n, m, dsub]
+        return parts.reshape(len(codes), self.dimension)
+
+    def lookup_table(self, query: np.ndarray) -> np.ndarray:
+        """Inner products of each query sub-vector with its codebook: [m, ksub]."""
+        parts = np.asarray(query, dtype=np.float32).reshape(self.m, self.dsub)
+        return np.einsum("mkd,md->mk", self.codebooks, parts)
+
+
+class PQIndex:
+    """Compressed vector store with asymmetric-distance scanning.
+
+    Only the m-byte codes are scanned, using one [m, ksub] lookup table per
+    query. The best `rerank` candidates are then re-scored exactly against
+    the original float32 vectors, which stay on disk in `directory` and are
+    read through a memory map. Deletes are tombstones.
+
+    Codes are held column-major ([m, n]), so the scan gathers one contiguous
+    row of codes per subspace. A standalone store measured by
+    eval/pq_benchmark.py: the service's VectorIndex does not use it.
+    """
+
+    def __init__(self, quantizer: ProductQuantizer, directory: str):
+        self.quantizer = quantizer
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.codes = np.empty((quantizer.m, 0), dtype=np.uint8)  # [m, n]
+        self.deleted = np.zeros(0, dtype=bool)
+        self.labels: List[str] = []
+        self._originals: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return int(len(self.labels) - self.deleted.sum())
+
+    @property
+    def _originals_path(self) -> str:
+        return os.path.join(self.directory, "originals.f32")
+
+    def _map_originals(self):
+        self._originals = None
+        if self.labels:
+            self._originals = np.memmap(
+                self._originals_path, dtype=np.float32, mode="r",
+                shape=(len(self.labels), self.quantizer.dimension),
+            )
+
+    def add(self, vectors: np.ndarray, labels: List[str]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        # Write at the logical end so a stale file from an older index is overwritten
+        mode = "r+b" if os.path.exists(self._originals_path) else "wb"
+        with open(self._originals_path, mode) as f:
+            f.seek(len(self.labels) * vectors.shape[1] * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+        self.codes = np.concatenate([self.codes, self.quantizer.encode(vectors).T], axis=1)
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(labels), dtype=bool)])
+        self.labels.extend(labels)
+        self._map_originals()
+
+    def delete(self, labels: List[str]) -> int:
+        targets = set(labels)
+        hits = np.array([label in targets for label in self.labels], dtype=bool)
+        newly = hits & ~self.deleted
+        self.deleted |= hits
+        return int(newly.sum())
+
+    def scan(self, query: np.ndarray) -> np.ndarray:
+        """Approximate inner product of the query with every stored vector."""
+        table = self.quantizer.lookup_table(query)
+        scores = np.zeros(len(self.labels), dtype=np.float32)
+        for j in range(self.quantizer.m):
+            scores += table[j].take(self.codes[j])
+        scores[self.deleted] = -np.inf
+        return scores
+
+    def search(self, query: np.ndarray, k: int = 10, rerank: int = 64):
+        """Top-k (labels, similarities); rerank=0 returns the raw ADC scores."""
+        if not len(self):
+            return [], np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        scores = self.scan(query)
+
+        depth = min(max(k, rerank), len(scores))
+        candidates = np.argpartition(-scores, depth - 1)[:depth]
+        candidates = candidates[np.isfinite(scores[candidates])]
+        if rerank:
+            candidates.sort()  # sequential reads from the memory map
+            exact = self._originals[candidates] @ query
+        else:
+            exact = scores[candidates]
+
+        order = np.argsort(-exact)[:k]
+        return [self.labels[i] for i in candidates[order]], exact[order].astype(np.float32)
+
+    def memory_bytes(self) -> dict:
+        n = max(len(self.labels), 1)
+        return {
+            "codes": self.codes.nbytes,
+            "codebooks": self.quantizer.codebooks.nbytes,
+            "bytes_per_vector": round((self.codes.nbytes + self.quantizer.codebooks.nbytes) / n, 2),
+            "float32_bytes_per_vector": 4 * self.quantizer.dimension,
+        }
+
+    def save(self):
+        q = self.quantizer
+        np.save(os.path.join(self.directory, "codebooks.npy"), q.codebooks)
+        # On disk one row per vector, as encode() returns them
+        np.save(os.path.join(self.directory, "codes.npy"), self.codes.T)
+        np.save(os.path.join(self.directory, "deleted.npy"), self.deleted)
+        with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dimension": q.dimension, "m": q.m, "ksub": q.ksub, "labels": self.labels}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "PQIndex":
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        quantizer = ProductQuantizer(meta["dimension"], meta["m"], int(np.log2(meta["ksub"])))
+        quantizer.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+
+        index = cls(quantizer, directory)
+        index.codes = np.ascontiguousarray(np.load(os.path.join(directory, "codes.npy")).T)
+        index.deleted = np.load(os.path.join(directory, "deleted.npy"))
+        index.labels = meta["labels"]
+        index._map_originals()
+        return index
@@ -0,0 +1,235 @@
+"""
+On-demand profiling of the embedding path.
+
+capture() recreates one pooled ONNX Runtime session with profiling on for a
+window, samples the Python stacks of every thread that is inside this
+service's code, and returns both as one Chrome trace (load it in
+chrome://tracing or ui.perfetto.dev) with a hot-spot summary under its
+"summary" key. ORT kernels and Python frames share the native thread ids, so
+an executor thread shows its stack and the operators it ran on one track.
+
+Operator timings cover the runs of that one session; the Python samples
+cover every thread. If the profiling session cannot be created, the capture
+still returns the Python side and reports ORT profiling as unavailable.
+Nothing here runs outside a capture: no sampler thread exists and the pool
+holds its usual sessions. Each capture covers the worker process that serves
+the request.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stage of a Python sample: the innermost frame matching (file, function);
+# a None function matches the whole file
+STAGE_FRAMES = (
+    ("embedding_engine.py", "_tokenize", "tokenize"),
+    ("embedding_engine.py", "_pad", "pad"),
+    ("embedding_engine.py", "_run", "inference"),
+    ("embedding_engine.py", "_mean_pooling", "pooling"),
+    ("embedding_engine.py", "_normalize", "pooling"),
+    ("session_pool.py", "session", "pool_wait"),
+    ("embedding_cache.py", None, "cache"),
+    ("quantization.py", None, "serialization"),
+    ("response_encoding.py", None, "serialization"),
+    ("main.py", "encode_embeddings", "serialization"),
+    # The handler's own synchronous work is building the response
+    ("main.py", "embed", "serialization"),
+)
+
+
+def _stage(stack) -> str:
+    for filename, _, function in reversed(stack):
+        name = os.path.basename(filename)
+        for stage_file, stage_function, stage in STAGE_FRAMES:
+            if name == stage_file and stage_function in (None, function):
+                return stage
+    return "other"
+
+
+class StackSampler:
+    """Samples the stacks of threads running this service's code every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.005, app_dir: str = APP_DIR):
+        self.interval = interval
+        self.app_dir = app_dir + os.sep
+        # The entry script (serve.py) sits at the bottom of the main thread at all times
+        main_file = getattr(sys.modules.get("__main__"), "__file__", None)
+        self.entry = os.path.abspath(main_file) if main_file else None
+        self.samples = []  # (seconds since start, native thread id, ((file, line, function), ...))
+        self._stop = threading.Event()
+        self._thread = None
+        self._caller = None
+        self.started = 0.0
+        self.started_ns = 0  # wall clock at start, to line up ORT timestamps
+
+    def start(self):
+        self._caller = threading.get_ident()  # waits out the window, not worth sampling
+        self.started_ns = time.time_ns()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+    def _in_app(self, filename: str) -> bool:
+        return filename.startswith(self.app_dir) and filename != self.entry
+
+    def _loop(self):
+        skip = {threading.get_ident(), self._caller}
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter() - self.started
+            native = {t.ident: t.native_id for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in skip:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                    frame = frame.f_back
+                # Idle pool threads and the event loop waiting in select() never
+                # pass through our files
+                if not any(self._in_app(filename) for filename, _, _ in stack):
+                    continue
+                stack.reverse()
+                self.samples.append((now, native.get(ident, ident), tuple(stack)))
+
+    def trace_events(self, pid: int) -> List[dict]:
+        """Samples as a flame chart: one "X" event per run of identical frames at each depth."""
+        events = []
+        open_frames: Dict[int, list] = {}  # tid -> [[frame, start], ...] from the root
+        last_seen: Dict[int, float] = {}
+
+        def close(tid, depth, end):
+            for frame, start in open_frames[tid][depth:]:
+                events.append({
+                    "ph": "X", "cat": "python", "pid": pid, "tid": tid,
+                    "name": frame[2], "ts": round(start * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+                    "args": {"file": os.path.relpath(frame[0], self.app_dir), "line": frame[1]},
+                })
+            del open_frames[tid][depth:]
+
+        for now, tid, stack in self.samples:
+            frames = open_frames.setdefault(tid, [])
+            if tid in last_seen and now - last_seen[tid] > 2 * self.interval:
+                close(tid, 0, last_seen[tid] + self.interval)
+            depth = 0
+            # Same function at the same depth continues; line numbers may move
+            while depth < min(len(frames), len(stack)) and frames[depth][0][::2] == stack[depth][::2]:
+                depth += 1
+            close(tid, depth, now)
+            frames.extend([frame, now] for frame in stack[depth:])
+            last_seen[tid] = now
+
+        for tid in open_frames:
+            close(tid, 0, last_seen[tid] + self.interval)
+        return events
+
+    def hot_spots(self, top: int) -> dict:
+        """Milliseconds per stage and per innermost function (self time), highest first."""
+        stages, functions = Counter(), Counter()
+        for _, _, stack in self.samples:
+            stages[_stage(stack)] += 1
+            filename, line, function = stack[-1]
+            functions[f"{function} ({os.path.basename(filename)}:{line})"] += 1
+        ms = self.interval * 1000
+        total = max(len(self.samples), 1)
+        return {
+            "samples": len(self.samples),
+            "interval_ms": ms,
+            "stages": {stage: round(count * ms, 1) for stage, count in stages.most_common()},
+            "functions": [
+                {"function": name, "ms": round(count * ms, 1), "share": round(count / total, 4)}
+                for name, count in functions.most_common(top)
+            ],
+        }
+
+
+def operator_hot_spots(events: List[dict], top: int) -> dict:
+    """Kernel time per operator type and per graph node from ORT "Node" events."""
+    ops, op_calls, nodes = Counter(), Counter(), Counter()
+    runs = run_us = 0
+    for event in events:
+        if event.get("cat") == "Node" and event["name"].endswith("_kernel_time"):
+            op = event.get("args", {}).get("op_name", "?")
+            ops[op] += event["dur"]
+            op_calls[op] += 1
+            nodes[event["name"][: -len("_kernel_time")]] += event["dur"]
+        elif event.get("name") == "model_run":
+            runs += 1
+            run_us += event["dur"]
+    kernel_us = max(sum(ops.values()), 1)
+    return {
+        "runs": runs,
+        "run_ms": round(run_us / 1000, 2),
+        "kernel_ms": round(sum(ops.values()) / 1000, 2),
+        "operators": [
+            {"op": op, "ms": round(us / 1000, 2), "calls": op_calls[op], "share": round(us / kernel_us, 4)}
+            for op, us in ops.most_common(top)
+        ],
+        "nodes": [{"node": node, "ms": round(us / 1000, 2)} for node, us in nodes.most_common(top)],
+    }
+
+
+def capture(pool, seconds: float, top: int = 20, interval: float = 0.005,
+            directory: Optional[str] = None) -> dict:
+    """Profile `pool` and the Python request path for `seconds`; blocks meanwhile.
+
+    Returns a Chrome trace object ({"traceEvents": [...]}) with a "summary"
+    of the top-N operators, nodes, stages and Python functions.
+    """
+    directory = tempfile.mkdtemp(prefix="embed-profile-", dir=directory)
+    unavailable = None
+    try:
+        sampler = StackSampler(interval)
+        with ExitStack() as stack:
+            try:
+                profiles = stack.enter_context(pool.profiling(os.path.join(directory, "ort")))
+            except Exception as exc:
+                profiles, unavailable = [], f"{type(exc).__name__}: {exc}"
+            sampler.start()
+            time.sleep(seconds)
+            elapsed = sampler.stop()
+
+        pid = os.getpid()
+        events = []
+        for started_ns, path in profiles:
+            # ORT timestamps count from the session's own profiling start
+            offset_us = (started_ns - sampler.started_ns) / 1000
+            with open(path, encoding="utf-8") as f:
+                for event in json.load(f):
+                    event["ts"] += offset_us
+                    if event["ts"] >= 0:
+                        event["pid"] = pid
+                        events.append(event)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if unavailable is None:
+        onnxruntime = {**operator_hot_spots(events, top), "sessions": f"1 of {pool.size}"}
+    else:
+        onnxruntime = {"available": False, "reason": unavailable}
+    summary = {
+        "seconds": round(elapsed, 3),
+        "onnxruntime": onnxruntime,
+        "python": sampler.hot_spots(top),
+    }
+    events.extend(sampler.trace_events(pid))
+    events.append({"ph": "M", "pid": pid, "name": "process_name", "args": {"name": "embedding-service"}})
+    for thread in threading.enumerate():
+        events.append({"ph": "M", "pid": pid, "tid": thread.native_id, "name": "thread_name",
+                       "args": {"name": thread.name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms", "summary": summary}
@@ -0,0 +1,115 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Output forms of an L2-normalized embedding, and what each costs per dimension
+FORMATS = ("float32", "float16", "int8", "binary")
+BITS_PER_DIMENSION = {"float32": 32, "float16": 16, "int8": 8, "binary": 1}
+
+# int8 codes carry one float32 scale per vector
+SCALE_BYTES = 4
+
+
+def bytes_per_vector(fmt: str, dimension: int) -> int:
+    size = -(-dimension * BITS_PER_DIMENSION[fmt] // 8)
+    return size + SCALE_BYTES if fmt == "int8" else size
+
+
+def truncate(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """Keep the leading `dimensions` components and re-normalize."""
+    if dimensions is None or dimensions >= vectors.shape[1]:
+        return vectors
+    if dimensions < 1:
+        raise ValueError("dimensions must be positive")
+    head = np.ascontiguousarray(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(head, axis=1, keepdims=True)
+    return head / np.maximum(norms, 1e-9)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes with one scale per vector: x ~= codes * scale."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits packed 8 per byte (384 dimensions -> 48 bytes)."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def hamming(query_bits: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Hamming distance from one packed query to every packed row."""
+    return np.bitwise_count(np.bitwise_xor(codes, query_bits)).sum(axis=1, dtype=np.int32)
+
+
+def compact(vectors: np.ndarray, fmt: str, dimensions: Optional[int] = None):
+    """(data, scales) for a response: scales is None except for int8."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    vectors = truncate(vectors, dimensions)
+    if fmt == "int8":
+        return quantize_int8(vectors)
+    if fmt == "binary":
+        return binarize(vectors), None
+    return np.ascontiguousarray(vectors, dtype=np.dtype(fmt).newbyteorder("<")), None
+
+
+class CompactIndex:
+    """Binary codes for a Hamming prefilter, int8 codes to re-score the survivors.
+
+    search() ranks every row by Hamming distance to the query's sign bits,
+    keeps the closest `candidates`, and scores those against the float
+    query: with the int8 codes ("int8"), the float vectors when kept
+    ("float"), or not at all (None, Hamming order only).
+    """
+
+    def __init__(self, vectors: np.ndarray, keep_float: bool = False):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dimension = vectors.shape[1]
+        self.binary = binarize(vectors)
+        self.codes, self.scales = quantize_int8(vectors)
+        self.vectors = vectors if keep_float else None
+
+    def __len__(self) -> int:
+        return len(self.binary)
+
+    def search(self, query: np.ndarray, k: int = 10, candidates: int = 100,
+               rescore: Optional[str] = "int8") -> Tuple[np.ndarray, np.ndarray]:
+        if rescore not in (None, "int8", "float"):
+            raise ValueError("rescore must be 'int8', 'float' or None")
+        if rescore == "float" and self.vectors is None:
+            raise ValueError("float re-scoring needs keep_float=True")
+
+        query = np.asarray(query, dtype=np.float32)
+        k = min(k, len(self))
+        distances = hamming(binarize(query[None, :])[0], self.binary)
+        candidates = min(max(candidates, k), len(self))
+        if candidates < len(self):
+            pool = np.argpartition(distances, candidates - 1)[:candidates]
+        else:
+            pool = np.arange(len(self))
+
+        if rescore is None:
+            # Cosine estimate from the fraction of differing sign bits
+            scores = np.cos(np.pi * distances[pool] / self.dimension).astype(np.float32)
+        elif rescore == "int8":
+            scores = (self.codes[pool].astype(np.float32) @ query) * self.scales[pool]
+        else:
+            scores = self.vectors[pool] @ query
+
+        order = np.argsort(-scores, kind="stable")[:k]
+        return pool[order], scores[order]
+
+    def memory_bytes(self) -> dict:
+        return {
+            "binary": self.binary.nbytes,
+            "int8": self.codes.nbytes + self.scales.nbytes,
+            "float32": self.vectors.nbytes if self.vectors is not None else 0,
+        }
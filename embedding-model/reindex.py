@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Incremental re-index: embed only the rows whose content has no vector yet.
+
+Reads a JSONL export with one {"tableName", "rowId", "content"} object per
+line and looks every content up in the model's VectorStore (vector_store.py)
+by its cache key. Contents without a stored vector are embedded in large
+batches and appended to the store; everything else costs a hash. Compared
+with the rows recorded by the previous run it then writes a delta:
+
+    {"op": "upsert", "tableName": ..., "rowId": ..., "vector": [...]}
+    {"op": "delete", "tableName": ..., "rowId": ...}
+
+Upsert lines match the /index/upsert item shape (rowId + precomputed
+vector). Deletes only cover tables present in the export. --all emits an
+upsert for every row, e.g. to rebuild a lost collection from the store.
+
+Usage (from the embedding-model directory):
+    python reindex.py export.jsonl --store ./index/store --delta delta.jsonl --stats stats.json
+    MODEL_VARIANT=q8 python reindex.py export.jsonl --all --delta q8_full.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_engine import DEFAULT_VARIANT, MODEL_VARIANTS, IndonesianEmbeddingEngine
+from session_config import SessionConfig
+from vector_store import VectorStore
+
+
+def read_export(path: str):
+    """{(tableName, rowId): content} in file order (last line wins) and the bad line count."""
+    rows = OrderedDict()
+    invalid = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                key = (str(record["tableName"]), str(record["rowId"]))
+                content = record["content"]
+            except (ValueError, KeyError, TypeError):
+                invalid += 1
+                continue
+            if not isinstance(content, str):
+                invalid += 1
+                continue
+            rows.pop(key, None)
+            rows[key] = content
+    return rows, invalid
+
+
+def reindex(args) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    rows, invalid = read_export(args.input)
+    timings["read"] = time.perf_counter() - start
+
+    variant = args.variant or os.getenv("MODEL_VARIANT", DEFAULT_VARIANT)
+    model_path = args.model_path or MODEL_VARIANTS[variant]
+    model_id = args.model_id or os.path.basename(model_path)
+    store = VectorStore(args.store, model_id, args.max_length)
+
+    start = time.perf_counter()
+    row_keys = {row: store.key(content) for row, content in rows.items()}
+    pending = OrderedDict()
+    for row, key in row_keys.items():
+        if key not in store.slots and key not in pending:
+            pending[key] = rows[row]
+    timings["hash"] = time.perf_counter() - start
+
+    embedded_s = 0.0
+    if pending:
+        start = time.perf_counter()
+        engine = IndonesianEmbeddingEngine(
+            model_path=model_path,
+            tokenizer_path=args.tokenizer,
+            max_length=args.max_length,
+            max_batch_tokens=args.max_batch_tokens,
+            intra_op_threads=args.threads,
+            model_id=model_id,
+            variant=variant,
+            session_config=SessionConfig.from_env(),
+        )
+        timings["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        keys, texts = list(pending), list(pending.values())
+        for begin in range(0, len(keys), args.batch):
+            # Appended per batch: an interrupted run resumes where it stopped
+            vectors = engine.embed_array(texts[begin:begin + args.batch])
+            store.add(keys[begin:begin + args.batch], vectors)
+            if args.progress:
+                print(f"  embedded {min(begin + args.batch, len(keys))}/{len(keys)}", file=sys.stderr)
+        embedded_s = timings["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    previous = store.load_rows()
+    current = {}
+    upserts = []
+    changed = 0
+    for (table, row_id), key in row_keys.items():
+        hex_key = key.hex()
+        current.setdefault(table, {})[row_id] = hex_key
+        if previous.get(table, {}).get(row_id) != hex_key:
+            changed += 1
+            upserts.append((table, row_id, key))
+        elif args.all:
+            upserts.append((table, row_id, key))
+    deletes = [
+        (table, row_id)
+        for table in current
+        for row_id in previous.get(table, {})
+        if row_id not in current[table]
+    ]
+
+    written = 0
+    with open(args.delta, "w", encoding="utf-8") as f:
+        for begin in range(0, len(upserts), args.batch):
+            chunk = upserts[begin:begin + args.batch]
+            vectors = np.empty((len(chunk), store.dimension), dtype=np.float32)
+            store.lookup([key for _, _, key in chunk], vectors)
+            for (table, row_id, _), vector in zip(chunk, vectors.tolist()):
+                f.write(json.dumps({"op": "upsert", "tableName": table, "rowId": row_id, "vector": vector}))
+                f.write("\n")
+                written += 1
+        for table, row_id in deletes:
+            f.write(json.dumps({"op": "delete", "tableName": table, "rowId": row_id}))
+            f.write("\n")
+
+    # Tables missing from this export keep their recorded rows
+    state = dict(previous)
+    state.update(current)
+    store.save_rows(state)
+    timings["delta"] = time.perf_counter() - start
+
+    total_s = sum(timings.values())
+    return {
+        "input": args.input,
+        "model_id": model_id,
+        "rows": len(rows),
+        "invalid_lines": invalid,
+        "unique_contents": len(set(row_keys.values())),
+        "store_hits": len(set(row_keys.values())) - len(pending),
+        "embedded": len(pending),
+        "upserts": written,
+        "deletes": len(deletes),
+        "changed": changed,
+        "unchanged": len(rows) - changed,
+        "seconds": {name: round(value, 3) for name, value in timings.items()},
+        "total_s": round(total_s, 3),
+        "rows_per_s": round(len(rows) / total_s, 1) if total_s else None,
+        "embedded_per_s": round(len(pending) / embedded_s, 1) if embedded_s else None,
+        "store": store.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed only new/changed rows and write the index delta")
+    parser.add_argument("input", help="JSONL export of tableName, rowId, content")
+    parser.add_argument("--store", default="./index/store", help="content-addressed vector store root")
+    parser.add_argument("--delta", default="delta.jsonl", help="where to write upsert/delete lines")
+    parser.add_argument("--stats", default=None, help="write throughput stats as JSON")
+    parser.add_argument("--all", action="store_true", help="emit an upsert for every row, changed or not")
+    parser.add_argument("--variant", default=None, help=f"one of {sorted(MODEL_VARIANTS)} (MODEL_VARIANT)")
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--model-id", default=None, help="store key (default: model file name)")
+    parser.add_argument("--tokenizer", default="./onnx/tokenizer.json")
+    parser.add_argument("--max-length", type=int, default=384)
+    parser.add_argument("--max-batch-tokens", type=int, default=int(os.getenv("EMBED_MAX_BATCH_TOKENS", "16384")))
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch", type=int, default=2048, help="texts per embed/append round")
+    parser.add_argument("--progress", action="store_true")
+    args = parser.parse_args()
+
+    stats = reindex(args)
+    print(f"{stats['rows']} rows ({stats['invalid_lines']} invalid lines), {stats['unique_contents']} unique contents:"
+          f" {stats['store_hits']} from the store, {stats['embedded']} embedded")
+    print(f"delta: {stats['upserts']} upserts, {stats['deletes']} deletes -> {args.delta}")
+    print(f"{stats['total_s']} s total ({stats['rows_per_s']} rows/s"
+          + (f", {stats['embedded_per_s']} embedded/s" if stats["embedded_per_s"] else "") + f"): {stats['seconds']}")
+
+    if args.stats:
+        with open(args.stats, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
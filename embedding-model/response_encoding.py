@@ -0,0 +1,72 @@
+import base64
+import io
+from typing import Optional
+
+import numpy as np
+
+MEDIA_JSON = "application/json"
+MEDIA_OCTET = "application/octet-stream"
+MEDIA_NPY = "application/x-npy"
+MEDIA_MSGPACK = "application/msgpack"
+
+_MEDIA_ALIASES = {
+    MEDIA_JSON: MEDIA_JSON,
+    MEDIA_OCTET: MEDIA_OCTET,
+    MEDIA_NPY: MEDIA_NPY,
+    "application/npy": MEDIA_NPY,
+    MEDIA_MSGPACK: MEDIA_MSGPACK,
+    "application/x-msgpack": MEDIA_MSGPACK,
+    "application/vnd.msgpack": MEDIA_MSGPACK,
+}
+
+# Explicit little-endian so clients can decode without guessing byte order
+DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response media type from an Accept header (JSON by default)."""
+    if not accept:
+        return MEDIA_JSON
+
+    candidates = []
+    for order, part in enumerate(accept.split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        quality = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        media = _MEDIA_ALIASES.get(fields[0].lower())
+        if media is not None and quality > 0:
+            candidates.append((-quality, order, media))
+
+    return min(candidates)[2] if candidates else MEDIA_JSON
+
+
+def as_dtype(vectors: np.ndarray, dtype: str) -> np.ndarray:
+    return np.ascontiguousarray(vectors, dtype=DTYPES[dtype])
+
+
+def encode_base64(vectors: np.ndarray) -> str:
+    return base64.b64encode(vectors.data).decode("ascii")
+
+
+def encode_npy(vectors: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, vectors, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def encode_msgpack(vectors: np.ndarray, meta: dict) -> bytes:
+    import msgpack
+
+    payload = dict(meta)
+    payload["dtype"] = vectors.dtype.name
+    payload["shape"] = list(vectors.shape)
+    payload["embeddings"] = vectors.tobytes()
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Multi-worker launcher for the embedding service.
+
+Starts one uvicorn worker per available core (cgroup quota and affinity
+aware, see session_config.available_cpus) unless --workers is given. Each
+worker pins itself to its share of the cores and runs single-threaded ONNX
+sessions over the memory-mapped weights from export_shared_weights.py, so
+the model's memory is paid once rather than once per worker. Without
+those files it starts a single worker. With several workers the vector
+index endpoints (/index/*, /search, /rerank by rowIds) answer 501: the
+index lives in one process's memory.
+
+Usage (from the embedding-model directory):
+    python serve.py                      # workers = available cores
+    python serve.py --workers 4 --port 8000
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+import shared_weights
+from embedding_engine import DEFAULT_VARIANT, MODEL_VARIANTS, fused_model_path
+from session_config import available_cpus
+
+
+def served_model_path() -> str:
+    """The model file the workers will load (the fused export when it exists)."""
+    path = os.getenv("MODEL_PATH") or MODEL_VARIANTS.get(os.getenv("MODEL_VARIANT", DEFAULT_VARIANT), "")
+    fused = fused_model_path(path)
+    return fused if os.path.exists(fused) else path
+
+
+def weights_shared(model_path: str) -> bool:
+    if os.getenv("ORT_SHARED_WEIGHTS", "").strip().lower() in ("0", "false", "no", "off"):
+        return False
+    return shared_weights.available(model_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the embedding service with several workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("EMBED_WORKERS", "0")),
+                        help="worker processes (0 = one per available core)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    workers = args.workers or cpus
+    model_path = served_model_path()
+    if workers > 1 and not weights_shared(model_path):
+        # Every worker would load its own full copy of the model
+        print(f"serve.py: no shared weights for {model_path} (run export_shared_weights.py);"
+              f" starting 1 worker instead of {workers}", file=sys.stderr)
+        workers = 1
+
+    # Inherited by the workers (main.py reads them at import)
+    os.environ["EMBED_WORKERS"] = str(workers)
+    os.environ.setdefault("EMBED_POOL_SIZE", "1")
+    os.environ.setdefault("EMBED_INTRA_OP_THREADS", str(max(1, cpus // workers)))
+    if workers > 1:
+        # Fusions above "basic" rewrite weights into new private initializers
+        os.environ.setdefault("ORT_GRAPH_OPTIMIZATION", "basic")
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import math
+import os
+import platform
+from typing import Optional
+
+import onnxruntime as ort
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def cgroup_cpu_limit(root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """CPU quota of the container in cores (e.g. 0.5), or None if unlimited.
+
+    Reads cgroup v2 `cpu.max`, falling back to v1 `cpu.cfs_quota_us` /
+    `cpu.cfs_period_us`.
+    """
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    for directory in ("cpu", "cpu,cpuacct", "cpuacct,cpu"):
+        try:
+            with open(os.path.join(root, directory, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(root, directory, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            continue
+        return None if quota <= 0 or period <= 0 else quota / period
+    return None
+
+
+def available_cpus() -> int:
+    """Cores this process may actually use: affinity mask capped by the cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+class SessionConfig:
+    """ONNX Runtime session settings shared by every session in the pool.
+
+    `intra_op_threads=0` means one share of `available_cpus()` per pooled
+    session. `allow_spinning=None` spins only when the cgroup quota is at
+    least one full core; busy-waiting on a fractional quota burns the
+    budget the next inference needs. With `optimized_model_dir` set, the
+    first session writes its optimized graph there and later starts load
+    it with graph optimizations disabled. "extended" is the default level:
+    it has the transformer fusions, and unlike "all" its serialized graph
+    carries no layout transforms tied to the CPU that produced it.
+
+    `shared_weights=None` builds sessions over the memory-mapped weights
+    from export_shared_weights.py whenever they exist next to the model
+    (see shared_weights.py); the optimized-graph cache is skipped then,
+    since a saved graph would carry its own copy of the weights.
+    """
+
+    def __init__(
+        self,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 1,
+        execution_mode: str = "sequential",
+        graph_optimization: str = "extended",
+        enable_cpu_mem_arena: bool = True,
+        enable_mem_pattern: bool = True,
+        allow_spinning: Optional[bool] = None,
+        optimized_model_dir: Optional[str] = None,
+        shared_weights: Optional[bool] = None,
+    ):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"execution_mode must be one of {sorted(EXECUTION_MODES)}")
+        if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"graph_optimization must be one of {sorted(GRAPH_OPTIMIZATION_LEVELS)}")
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.execution_mode = execution_mode
+        self.graph_optimization = graph_optimization
+        self.enable_cpu_mem_arena = enable_cpu_mem_arena
+        self.enable_mem_pattern = enable_mem_pattern
+        self.allow_spinning = allow_spinning
+        self.optimized_model_dir = optimized_model_dir
+        self.shared_weights = shared_weights
+
+    @classmethod
+    def from_env(cls, environ=os.environ, defaults: Optional[dict] = None) -> "SessionConfig":
+        """`defaults`, then ORT_SESSION_CONFIG (a JSON file), then ORT_* overrides."""
+        values = dict(defaults or {})
+        path = environ.get("ORT_SESSION_CONFIG")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                values.update(json.load(f))
+
+        def flag(value: str) -> bool:
+            return value.strip().lower() in ("1", "true", "yes", "on")
+
+        overrides = {
+            "ORT_INTRA_OP_THREADS": ("intra_op_threads", int),
+            "ORT_INTER_OP_THREADS": ("inter_op_threads", int),
+            "ORT_EXECUTION_MODE": ("execution_mode", str),
+            "ORT_GRAPH_OPTIMIZATION": ("graph_optimization", str),
+            "ORT_CPU_MEM_ARENA": ("enable_cpu_mem_arena", flag),
+            "ORT_MEM_PATTERN": ("enable_mem_pattern", flag),
+            "ORT_ALLOW_SPINNING": ("allow_spinning", flag),
+            "ORT_OPTIMIZED_MODEL_DIR": ("optimized_model_dir", str),
+            "ORT_SHARED_WEIGHTS": ("shared_weights", flag),
+        }
+        for name, (key, parse) in overrides.items():
+            raw = environ.get(name)
+            if raw is None:
+                continue
+            if key == "optimized_model_dir":
+                values[key] = raw or None  # set but empty: no graph cache
+            elif raw != "":
+                values[key] = parse(raw)
+        return cls(**values)
+
+    def threads_per_session(self, pool_size: int) -> int:
+        if self.intra_op_threads > 0:
+            return self.intra_op_threads
+        return max(1, available_cpus() // max(1, pool_size))
+
+    def spinning(self) -> bool:
+        if self.allow_spinning is not None:
+            return self.allow_spinning
+        limit = cgroup_cpu_limit()
+        return limit is None or limit >= 1
+
+    def session_options(self, intra_op_threads: int) -> ort.SessionOptions:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[self.graph_optimization]
+        options.enable_cpu_mem_arena = self.enable_cpu_mem_arena
+        options.enable_mem_pattern = self.enable_mem_pattern
+        options.add_session_config_entry("session.intra_op.allow_spinning", "1" if self.spinning() else "0")
+        options.add_session_config_entry("session.inter_op.allow_spinning", "1" if self.spinning() else "0")
+        return options
+
+    def optimized_model_path(self, model_path: str) -> Optional[str]:
+        """Cache file for the optimized graph of `model_path`.
+
+        The name covers everything the optimized graph depends on (model
+        file, optimization level, onnxruntime version, CPU architecture), so
+        a stale file is simply never looked up again.
+        """
+        if not self.optimized_model_dir or self.graph_optimization == "disable":
+            return None
+        stat = os.stat(model_path)
+        key = "|".join([
+            os.path.abspath(model_path), str(stat.st_size), str(stat.st_mtime_ns),
+            self.graph_optimization, ort.__version__, platform.machine(),
+        ])
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self.optimized_model_dir, f"{name}.{self.graph_optimization}.{digest}.onnx")
+
+    def snapshot(self) -> dict:
+        return {
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "execution_mode": self.execution_mode,
+            "graph_optimization": self.graph_optimization,
+            "enable_cpu_mem_arena": self.enable_cpu_mem_arena,
+            "enable_mem_pattern": self.enable_mem_pattern,
+            "allow_spinning": self.spinning(),
+            "optimized_model_dir": self.optimized_model_dir,
+            "shared_weights": self.shared_weights,
+            "cgroup_cpu_limit": cgroup_cpu_limit(),
+            "available_cpus": available_cpus(),
+        }
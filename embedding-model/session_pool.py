@@ -0,0 +1,182 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import onnxruntime as ort
+
+import shared_weights
+from session_config import SessionConfig
+
+
+class SessionPool:
+    """Fixed set of ONNX Runtime sessions over the same model.
+
+    Each session gets its own intra-op thread count so that `size` inferences
+    can run side by side without oversubscribing the CPU. Unless given, that
+    count is the cgroup-aware CPU share from `config`.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        size: int = 1,
+        intra_op_threads: int = 0,
+        config: Optional[SessionConfig] = None,
+    ):
+        self.model_path = model_path
+        self.size = max(1, size)
+        self.config = config or SessionConfig()
+        self.intra_op_threads = intra_op_threads or self.config.threads_per_session(self.size)
+        self.optimized_graph = None  # "created" or "cached" when the graph cache is used
+        self.shared = shared_weights.load(model_path, self.config.shared_weights)
+
+        self.sessions = [self._create_session() for _ in range(self.size)]
+
+        # LIFO so the most recently used (cache-warm) session is reused first
+        self._idle = queue.LifoQueue()
+        for session in self.sessions:
+            self._idle.put(session)
+
+        # Called as on_swap(old, new) when `profiling` replaces a session
+        # (either side may be None), so owners of per-session state follow
+        self.on_swap: Optional[Callable] = None
+
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait_ms = 0.0
+
+    def _options(self, profile_prefix: Optional[str] = None) -> ort.SessionOptions:
+        options = self.config.session_options(self.intra_op_threads)
+        if profile_prefix is not None:
+            options.enable_profiling = True
+            options.profile_file_prefix = profile_prefix
+        return options
+
+    def _create_session(self, profile_prefix: Optional[str] = None) -> ort.InferenceSession:
+        options = self._options(profile_prefix)
+        if self.shared is not None:
+            self.shared.apply(options)
+            return self._load(self.shared.graph_path, options)
+
+        cached = self.config.optimized_model_path(self.model_path)
+
+        if cached is not None and os.path.exists(cached):
+            # Already optimized for this model/level/runtime: skip the passes
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            self.optimized_graph = self.optimized_graph or "cached"
+            return self._load(cached, options)
+
+        if cached is not None:
+            try:
+                os.makedirs(os.path.dirname(cached), exist_ok=True)
+                # Per-process temp name: several workers may start at once
+                temporary = f"{cached}.{os.getpid()}.tmp"
+                options.optimized_model_filepath = temporary
+                session = self._load(self.model_path, options)
+                os.replace(temporary, cached)
+                self.optimized_graph = "created"
+                return session
+            except Exception:
+                # Read-only directory or a graph ORT cannot serialize: run uncached
+                options = self._options(profile_prefix)
+
+        return self._load(self.model_path, options)
+
+    def _load(self, path: str, options: ort.SessionOptions) -> ort.InferenceSession:
+        return ort.InferenceSession(
+            path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    @contextmanager
+    def session(self):
+        start = time.perf_counter()
+        try:
+            session = self._idle.get_nowait()
+            waited = False
+        except queue.Empty:
+            session = self._idle.get()
+            waited = True
+
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            if waited:
+                self.waited += 1
+                self.total_wait_ms += (time.perf_counter() - start) * 1000
+
+        try:
+            yield session
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(session)
+
+    def _swap(self, slot: int, session: Optional[ort.InferenceSession]):
+        old, self.sessions[slot] = self.sessions[slot], session
+        if self.on_swap is not None:
+            self.on_swap(old, session)
+
+    @contextmanager
+    def profiling(self, profile_prefix: str):
+        """Recreate one pooled session with ORT profiling on until the block exits.
+
+        The session is released before its profiling twin is created and
+        again before the plain one is restored, so the model is never held
+        twice (with private weights every session has its own copy); the
+        pool serves with one session fewer during each swap. Yields a list
+        that holds (profiling start ns, profile file) once the block exits.
+        """
+        profiles = []
+        session = self._idle.get()
+        slot = next(i for i, pooled in enumerate(self.sessions) if pooled is session)
+        del session
+        self._swap(slot, None)
+        try:
+            profiled = self._create_session(profile_prefix)
+        except BaseException:
+            self._restore(slot)
+            raise
+        self._swap(slot, profiled)
+        self._idle.put(profiled)
+        try:
+            yield profiles
+        finally:
+            # Every session checked out once, so no run is still inside the
+            # profiling one when its profile is ended
+            drained = [self._idle.get() for _ in range(self.size)]
+            for session in drained:
+                if session is not profiled:
+                    self._idle.put(session)
+            del drained, session
+            profiles.append((profiled.get_profiling_start_time_ns(), profiled.end_profiling()))
+            del profiled
+            self._swap(slot, None)
+            self._restore(slot)
+
+    def _restore(self, slot: int):
+        session = self._create_session()
+        self._swap(slot, session)
+        self._idle.put(session)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "intra_op_threads": self.intra_op_threads,
+                "optimized_graph": self.optimized_graph,
+                "shared_weights_mb": round(self.shared.nbytes / (1024 * 1024), 1) if self.shared else None,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "avg_wait_ms": round(self.total_wait_ms / self.waited, 3) if self.waited else 0.0,
+            }
@@ -0,0 +1,59 @@
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+ALIGNMENT = 64
+
+
+def shared_paths(model_path: str) -> Tuple[str, str, str]:
+    """(graph, weights, manifest) paths written by export_shared_weights.py."""
+    base = os.path.splitext(model_path)[0]
+    return base + ".shared.onnx", base + ".shared.bin", base + ".shared.json"
+
+
+def available(model_path: str) -> bool:
+    return all(os.path.exists(path) for path in shared_paths(model_path))
+
+
+class SharedWeights:
+    """Model initializers backed by one read-only memory map.
+
+    Every process that maps the same .bin file reads the same page-cache
+    pages, so N workers hold one copy of the weights instead of N. The
+    arrays are handed to ONNX Runtime with `SessionOptions.add_initializer`,
+    which uses the caller's buffer instead of deserializing the tensor.
+    Pre-packing is disabled because it would copy weights into private,
+    re-laid-out buffers.
+    """
+
+    def __init__(self, model_path: str):
+        self.graph_path, self.weights_path, manifest_path = shared_paths(model_path)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.nbytes = manifest["bytes"]
+        self._map = np.memmap(self.weights_path, dtype=np.uint8, mode="r", shape=(self.nbytes,))
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, ort.OrtValue] = {}
+        for tensor in manifest["tensors"]:
+            dtype = np.dtype(tensor["dtype"])
+            count = int(np.prod(tensor["shape"], dtype=np.int64))
+            start = tensor["offset"]
+            array = self._map[start:start + count * dtype.itemsize].view(dtype).reshape(tensor["shape"])
+            self.arrays[tensor["name"]] = array
+            self.values[tensor["name"]] = ort.OrtValue.ortvalue_from_numpy(array)
+
+    def apply(self, options: ort.SessionOptions):
+        for name, value in self.values.items():
+            options.add_initializer(name, value)
+        options.add_session_config_entry("session.disable_prepacking", "1")
+
+
+def load(model_path: str, enabled: Optional[bool] = None) -> Optional[SharedWeights]:
+    """SharedWeights for `model_path` if exported (and not disabled), else None."""
+    if enabled is False or (enabled is None and not available(model_path)):
+        return None
+    return SharedWeights(model_path)
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import struct
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from batcher import BULK, Overloaded
+from response_encoding import DTYPES
+
+MEDIA_NDJSON = "application/x-ndjson"
+MEDIA_OCTET = "application/octet-stream"
+
+MAX_STREAM_BATCH = 1024
+
+
+class StreamLineError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+
+
+async def iter_body(receive) -> AsyncIterator[bytes]:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body = message.get("body", b"")
+        if body:
+            yield body
+        if not message.get("more_body", False):
+            return
+
+
+async def iter_records(chunks: AsyncIterator[bytes]):
+    """Yield (id, text) per NDJSON line, or a StreamLineError for bad lines."""
+    buffer = b""
+    line_no = 0
+
+    def parse(raw: bytes):
+        nonlocal line_no
+        line_no += 1
+        raw = raw.strip()
+        if not raw:
+            return None
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            return StreamLineError(line_no, "invalid JSON")
+        if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+            return StreamLineError(line_no, "expected an object with a string 'text'")
+        return record.get("id", line_no), record["text"]
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            item = parse(raw)
+            if item is not None:
+                yield item
+
+    item = parse(buffer)
+    if item is not None:
+        yield item
+
+
+async def iter_batches(records, batch_size: int):
+    """Group records into (ids, texts, errors) sub-batches of at most batch_size texts."""
+    ids, texts, errors = [], [], []
+    async for item in records:
+        if isinstance(item, StreamLineError):
+            errors.append(item)
+            continue
+        ids.append(item[0])
+        texts.append(item[1])
+        if len(texts) >= batch_size:
+            yield ids, texts, errors
+            ids, texts, errors = [], [], []
+    if texts or errors:
+        yield ids, texts, errors
+
+
+def encode_ndjson(ids: List, vectors: Optional[np.ndarray], errors: List[StreamLineError]) -> bytes:
+    lines = [json.dumps({"line": e.line, "error": str(e)}) for e in errors]
+    if vectors is not None:
+        lines.extend(
+            json.dumps({"id": i, "embedding": v}) for i, v in zip(ids, vectors.tolist())
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+def encode_binary(ids: List, vectors: Optional[np.ndarray]) -> bytes:
+    # Record: <u4 id length><utf-8 id><dimension x dtype vector>
+    if vectors is None:
+        return b""
+    parts = []
+    for i, row in zip(ids, vectors):
+        key = str(i).encode("utf-8")
+        parts.append(struct.pack("<I", len(key)))
+        parts.append(key)
+        parts.append(row.tobytes())
+    return b"".join(parts)
+
+
+class EmbedStreamEndpoint:
+    """ASGI endpoint for POST /embed/stream.
+
+    Reads `{"id": ..., "text": ...}` NDJSON lines, embeds them in sub-batches
+    of `batch_size` and writes each sub-batch back as soon as it is done, so
+    neither the request nor the response is ever held in memory whole. The
+    next sub-batch is parsed while the previous one is being embedded.
+    Sub-batches are bulk work for the batcher: the stream is admitted
+    against the bulk queue limit once, up front, and then yields to
+    interactive requests between sub-batches instead of failing midway.
+
+    Query parameters: `batch_size`, `format` (`ndjson` or `binary`) and
+    `dtype` (`float32` or `float16`, binary only). Malformed lines are
+    reported as `{"line": n, "error": ...}` records in NDJSON mode and
+    skipped in binary mode.
+    """
+
+    def __init__(self, get_engine, get_batcher, batch_size: int = 64):
+        self.get_engine = get_engine
+        self.get_batcher = get_batcher
+        self.batch_size = batch_size
+
+    def _options(self, scope) -> Tuple[int, str, str]:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        batch_size = int(query.get("batch_size", [self.batch_size])[0])
+        fmt = query.get("format", ["ndjson"])[0]
+        dtype = query.get("dtype", ["float32"])[0]
+        if not 1 <= batch_size <= MAX_STREAM_BATCH:
+            raise ValueError(f"batch_size must be between 1 and {MAX_STREAM_BATCH}")
+        if fmt not in ("ndjson", "binary"):
+            raise ValueError("format must be 'ndjson' or 'binary'")
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(DTYPES)}")
+        return batch_size, fmt, dtype
+
+    async def _reject(self, send, status: int, detail: str, headers=()):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        try:
+            batch_size, fmt, dtype = self._options(scope)
+        except ValueError as exc:
+            await self._reject(send, 400, str(exc))
+            return
+
+        engine, batcher = self.get_engine(), self.get_batcher()
+        if engine is None or batcher is None:
+            await self._reject(send, 503, "model is still loading", [(b"retry-after", b"5")])
+            return
+        try:
+            batcher.admit(BULK)
+        except Overloaded as exc:
+            await self._reject(send, exc.status, f"{exc.priority} queue is full, retry later",
+                               [(b"retry-after", str(exc.retry_after).encode())])
+            return
+
+        headers = [(b"content-type", (MEDIA_NDJSON if fmt == "ndjson" else MEDIA_OCTET).encode())]
+        if fmt == "binary":
+            headers.append((b"x-embedding-dimension", str(engine.dimension).encode()))
+            headers.append((b"x-embedding-dtype", dtype.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+        async def emit(ids, errors, future):
+            vectors = await future if future is not None else None
+            if fmt == "ndjson":
+                body = encode_ndjson(ids, vectors, errors)
+            else:
+                body = encode_binary(ids, None if vectors is None else vectors.astype(DTYPES[dtype]))
+            if body:
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+
+        pending = None
+        batches = iter_batches(iter_records(iter_body(receive)), batch_size)
+        try:
+            async for ids, texts, errors in batches:
+                future = None
+                if texts:
+                    future = asyncio.ensure_future(batcher.submit(texts, BULK, admitted=True))
+                previous, pending = pending, (ids, errors, future)
+                if previous is not None:
+                    await emit(*previous)
+
+            last, pending = pending, None
+            if last is not None:
+                await emit(*last)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            # A send that failed midway (client gone) leaves the next
+            # sub-batch outstanding: cancel it so it gives up its queue
+            # place, or retrieve its result if it already finished
+            future = pending[2] if pending is not None else None
+            if future is not None:
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled():
+                    future.exception()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache, cache_key
+
+
+def test_key_keeps_edge_whitespace():
+    # XLM-R's Metaspace pre-tokenizer turns a trailing space into its own token
+    assert cache_key("model", 256, "Pengumuman ") != cache_key("model", 256, "Pengumuman")
+    assert cache_key("model", 256, " Pengumuman") != cache_key("model", 256, "Pengumuman")
+
+
+def test_key_depends_on_model_and_length():
+    assert cache_key("model", 256, "Berita") == cache_key("model", 256, "Berita")
+    assert cache_key("model", 256, "Berita") != cache_key("model", 128, "Berita")
+    assert cache_key("model", 256, "Berita") != cache_key("other", 256, "Berita")
+
+
+def test_trailing_space_is_a_separate_entry():
+    cache = EmbeddingCache(capacity=4, dimension=2)
+    keys = [cache_key("model", 256, "Berita"), cache_key("model", 256, "Berita ")]
+    cache.store(keys[:1], np.array([[1.0, 0.0]], dtype=np.float32))
+
+    out = np.zeros((2, 2), dtype=np.float32)
+    assert cache.lookup(keys, out) == [1]
+    assert out[0].tolist() == [1.0, 0.0]
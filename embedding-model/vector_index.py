@@ -0,0 +1,499 @@
+import base64
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import hnsw_index
+from hnsw_index import HNSWIndex
+
+_TABLE_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+_ANN_SCRATCH = ".hnsw-build-"
+
+
+def check_table_name(table: str) -> str:
+    if not _TABLE_NAME.match(table):
+        raise ValueError(f"Invalid tableName {table!r}")
+    return table
+
+
+class TableIndex:
+    """Vectors of one tableName as rows of a contiguous float32 matrix.
+
+    A loaded index starts out backed by a read-only memory map of its .npy
+    file and is only copied into memory on its first mutation; a matrix
+    handed out by `snapshot` is treated the same way. Large tables
+    can additionally carry an HNSW graph (`ann`) that answers searches
+    approximately instead of scanning every row. While a new graph is built
+    in the background, `ann_backlog` collects the mutations it still has to
+    catch up on.
+    """
+
+    def __init__(self, dimension: int, vectors: Optional[np.ndarray] = None, row_ids: Optional[List[str]] = None):
+        self.dimension = dimension
+        self.row_ids: List[str] = list(row_ids or [])
+        self.slots: Dict[str, int] = {row_id: i for i, row_id in enumerate(self.row_ids)}
+        self._matrix = vectors if vectors is not None else np.empty((0, dimension), dtype=np.float32)
+        self._shared = False  # _matrix handed out by snapshot(): copy before writing
+        self.ann: Optional[HNSWIndex] = None
+        self.ann_ef: Optional[int] = None
+        self.ann_backlog: Optional[list] = None
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._matrix[: len(self.row_ids)]
+
+    def _reserve(self, size: int):
+        writable = not (isinstance(self._matrix, np.memmap) or self._shared)
+        if writable and self._matrix.shape[0] >= size:
+            return
+        capacity = self._matrix.shape[0]
+        if capacity < size:
+            capacity = max(size, 2 * capacity, 64)
+        grown = np.empty((capacity, self.dimension), dtype=np.float32)
+        grown[: len(self.row_ids)] = self.vectors
+        self._matrix = grown
+        self._shared = False
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Read-only (vectors, row_ids) as of now, without copying the matrix:
+        the next mutation copies it instead of writing to the one handed out."""
+        vectors = self.vectors.view()
+        vectors.flags.writeable = False
+        self._shared = True
+        return vectors, list(self.row_ids)
+
+    def upsert(self, row_ids: List[str], vectors: np.ndarray):
+        self._reserve(len(self.row_ids) + len(row_ids))
+        for row_id, vector in zip(row_ids, vectors):
+            slot = self.slots.get(row_id)
+            if slot is None:
+                slot = self.slots[row_id] = len(self.row_ids)
+                self.row_ids.append(row_id)
+            self._matrix[slot] = vector
+        if self.ann is not None:
+            self.ann.add(vectors, row_ids)
+        if self.ann_backlog is not None:
+            self.ann_backlog.append(("upsert", list(row_ids), np.array(vectors)))
+
+    def delete(self, row_ids: Iterable[str]) -> int:
+        self._reserve(len(self.row_ids))
+        deleted = 0
+        for row_id in row_ids:
+            slot = self.slots.pop(row_id, None)
+            if slot is None:
+                continue
+            # Move the last row into the hole to keep the matrix contiguous
+            last = len(self.row_ids) - 1
+            if slot != last:
+                moved = self.row_ids[last]
+                self._matrix[slot] = self._matrix[last]
+                self.row_ids[slot] = moved
+                self.slots[moved] = slot
+            self.row_ids.pop()
+            deleted += 1
+        if self.ann is not None:
+            self.ann.delete(row_ids)
+        if self.ann_backlog is not None:
+            self.ann_backlog.append(("delete", list(row_ids), None))
+        return deleted
+
+    def search(self, query: np.ndarray, k: int, min_score: float):
+        """Top-k (slots, scores) with score >= min_score, best first."""
+        if not self.row_ids:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        if self.ann is not None:
+            labels, scores = self.ann.search(query, k, self.ann_ef)
+            keep = scores >= min_score
+            slots = np.array([self.slots[label] for label in labels], dtype=np.intp)
+            return slots[keep], scores[keep]
+
+        scores = self.vectors @ query
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        order = np.argsort(-scores[candidates], kind="stable")
+        candidates = candidates[order]
+        return candidates, scores[candidates]
+
+
+def table_paths(directory: str, table: str) -> Tuple[str, str, str]:
+    """Snapshot vectors, snapshot row ids and journal of one table."""
+    base = os.path.join(directory, table)
+    return base + ".npy", base + ".ids.json", base + ".log"
+
+
+def journal_line(op: str, row_ids: List[str], vectors: Optional[np.ndarray] = None) -> bytes:
+    record = {"op": op, "rowIds": row_ids}
+    if vectors is not None:
+        record["vectors"] = base64.b64encode(np.ascontiguousarray(vectors, dtype="<f4").tobytes()).decode("ascii")
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+def read_journal(path: str, repair: bool = False) -> list:
+    """(op, row_ids, vectors or None) records of a journal, oldest first.
+
+    Reading stops at a torn last line (a crash mid-append); with `repair`
+    the file is cut back to the last whole record so later appends are
+    readable again.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("torn record")
+                record = json.loads(line)
+                row_ids = record["rowIds"]
+                vectors = None
+                if record["op"] == "upsert":
+                    raw = np.frombuffer(base64.b64decode(record["vectors"]), dtype="<f4")
+                    vectors = raw.reshape(len(row_ids), -1)
+                elif record["op"] != "delete":
+                    raise ValueError(f"unknown op {record['op']!r}")
+            except (ValueError, KeyError, TypeError):
+                break
+            records.append((record["op"], row_ids, vectors))
+            good += len(line)
+    if repair and good < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return records
+
+
+def replay(index: TableIndex, records: list) -> int:
+    """Apply journal records to `index`; returns the rows they touched."""
+    rows = 0
+    for op, row_ids, vectors in records:
+        if op == "upsert":
+            index.upsert(row_ids, vectors)
+        else:
+            index.delete(row_ids)
+        rows += len(row_ids)
+    return rows
+
+
+def read_snapshot(directory: str, table: str, dimension: Optional[int] = None) -> Optional[TableIndex]:
+    """The table's last compacted state, memory-mapped, or None if it has none."""
+    vectors_path, ids_path, _ = table_paths(directory, table)
+    if not (os.path.exists(vectors_path) and os.path.exists(ids_path)):
+        return None
+    with open(ids_path, encoding="utf-8") as f:
+        row_ids = json.load(f)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    dimension = dimension or vectors.shape[1]
+    if vectors.shape != (len(row_ids), dimension):
+        raise ValueError(f"Index files for {table!r} do not match (shape {vectors.shape})")
+    return TableIndex(dimension, vectors, row_ids)
+
+
+def load_table(directory: str, table: str) -> TableIndex:
+    """One table as the service sees it: snapshot plus journal, read-only on disk."""
+    check_table_name(table)
+    index = read_snapshot(directory, table)
+    records = read_journal(table_paths(directory, table)[2])
+    if index is None:
+        upserts = [vectors for op, _, vectors in records if op == "upsert"]
+        index = TableIndex(upserts[0].shape[1] if upserts else 0)
+    replay(index, records)
+    return index
+
+
+def _apply_ann_backlog(ann: HNSWIndex, backlog: list):
+    for op, ids, upserted in backlog:
+        if op == "upsert":
+            ann.add(upserted, ids)
+        else:
+            ann.delete(ids)
+
+
+class VectorIndex:
+    """Per-tableName vector index, persisted as memory-mappable .npy files.
+
+    A mutation only appends one line to the table's journal (<table>.log);
+    the .npy/.ids.json snapshot is rewritten, and the journal dropped, once
+    the journal holds more than `journal_share` of the table's rows and at
+    least `journal_min_rows`. Loading replays the journal over the snapshot.
+
+    Tables are scanned exactly unless `ann_min_rows` is set, in which case
+    tables with at least that many rows get an HNSW graph (M, ef_construction
+    from `ann_params`, query beam width `ann_ef`) saved next to their vectors
+    at each compaction. The pure-Python build runs in a child process
+    (hnsw_index.py, at `ann_nice` lower CPU priority) while the exact scan
+    keeps answering; the graph is then loaded back and caught up on the
+    mutations made meanwhile. Graphs are rebuilt the same way once more than
+    `ann_rebuild_share` of their nodes are tombstones left by deletes and
+    re-upserts.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        directory: Optional[str] = None,
+        ann_min_rows: int = 0,
+        ann_ef: Optional[int] = None,
+        ann_params: Optional[dict] = None,
+        journal_share: float = 0.25,
+        journal_min_rows: int = 1024,
+        ann_rebuild_share: float = 0.25,
+        ann_nice: int = 10,
+    ):
+        self.dimension = dimension
+        self.directory = directory
+        self.journal_share = journal_share
+        self.journal_min_rows = journal_min_rows
+        self._journaled: Dict[str, int] = {}  # rows in each table's journal
+        self.ann_min_rows = ann_min_rows
+        self.ann_ef = ann_ef
+        self.ann_params = ann_params or {}
+        self.ann_rebuild_share = ann_rebuild_share
+        self.ann_nice = ann_nice
+        self._ann_builds: Dict[str, threading.Thread] = {}
+        self.tables: Dict[str, TableIndex] = {}
+        self._lock = threading.RLock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.load()
+
+    def _paths(self, table: str):
+        return table_paths(self.directory, table)
+
+    def _ann_path(self, table: str) -> str:
+        return os.path.join(self.directory, table + ".hnsw.npz")
+
+    def _needs_ann(self, index: TableIndex) -> bool:
+        if not self.ann_min_rows or len(index) < self.ann_min_rows or index.ann_backlog is not None:
+            return False
+        if index.ann is None:
+            return True
+        return index.ann.size - len(index.ann) > self.ann_rebuild_share * index.ann.size
+
+    def _maybe_build_ann(self, table: str, index: TableIndex):
+        """Start a background graph build for `table` if it needs one (call under the lock)."""
+        if not self._needs_ann(index):
+            return
+        # The child reads the rows from a scratch file, written once here
+        # instead of copied: deletes move rows around while it builds
+        scratch = tempfile.mkdtemp(prefix=_ANN_SCRATCH, dir=self.directory)
+        np.save(os.path.join(scratch, "vectors.npy"), np.ascontiguousarray(index.vectors), allow_pickle=False)
+        with open(os.path.join(scratch, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(index.row_ids, f)
+        index.ann_backlog = []
+        thread = threading.Thread(
+            target=self._build_ann, args=(table, index, scratch), name=f"ann-{table}", daemon=True
+        )
+        self._ann_builds[table] = thread
+        thread.start()
+
+    def _build_ann(self, table: str, index: TableIndex, scratch: str):
+        ann = None
+        try:
+            params = dict(self.ann_params)
+            if self.ann_ef:
+                params.setdefault("ef_search", self.ann_ef)
+            graph_path = os.path.join(scratch, "graph.npz")
+            command = [sys.executable, hnsw_index.__file__, os.path.join(scratch, "vectors.npy"),
+                       os.path.join(scratch, "ids.json"), graph_path, "--nice", str(self.ann_nice)]
+            for name, value in params.items():
+                command += ["--" + name.replace("_", "-"), str(value)]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            built = HNSWIndex.load(graph_path)
+
+            # Catch up outside the lock while mutations keep arriving, so
+            # only the last few are replayed while holding it
+            while True:
+                with self._lock:
+                    backlog, index.ann_backlog = index.ann_backlog, []
+                if not backlog:
+                    break
+                _apply_ann_backlog(built, backlog)
+            ann = built
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+            with self._lock:
+                backlog, index.ann_backlog = index.ann_backlog, None
+                if self._ann_builds.get(table) is threading.current_thread():
+                    del self._ann_builds[table]
+                # Dropped meanwhile (or the build failed): keep what there was
+                if ann is not None and self.tables.get(table) is index:
+                    _apply_ann_backlog(ann, backlog)
+                    index.ann, index.ann_ef = ann, self.ann_ef
+                    # Compact so the saved graph and snapshot match
+                    self.save(table)
+
+    def wait_for_ann(self, timeout: Optional[float] = None):
+        """Block until the background graph builds started so far have finished."""
+        for thread in list(self._ann_builds.values()):
+            thread.join(timeout)
+
+    def load(self):
+        with self._lock:
+            # Scratch files of graph builds cut short by a restart
+            for name in os.listdir(self.directory):
+                if name.startswith(_ANN_SCRATCH):
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            suffixes = (".ids.json", ".log")
+            names = sorted({
+                name[: -len(suffix)]
+                for name in os.listdir(self.directory)
+                for suffix in suffixes
+                if name.endswith(suffix)
+            })
+            for table in names:
+                index = read_snapshot(self.directory, table, self.dimension)
+                if index is None:
+                    index = TableIndex(self.dimension)
+
+                # The saved graph matches the snapshot; the journal then goes to both
+                ann_path = self._ann_path(table)
+                if self.ann_min_rows and len(index) and os.path.exists(ann_path):
+                    ann = HNSWIndex.load(ann_path)
+                    if len(ann) == len(index):
+                        index.ann, index.ann_ef = ann, self.ann_ef
+
+                records = read_journal(self._paths(table)[2], repair=True)
+                self._journaled[table] = replay(index, records)
+                if len(index) == 0:
+                    self.save(table)  # drops the leftover files
+                    continue
+                self.tables[table] = index
+                self._maybe_build_ann(table, index)
+
+    def save(self, table: str):
+        if not self.directory:
+            return
+        with self._lock:
+            index = self.tables.get(table)
+            vectors_path, ids_path, journal_path = self._paths(table)
+            ann_path = self._ann_path(table)
+            self._journaled[table] = 0
+            if index is None or len(index) == 0:
+                for path in (vectors_path, ids_path, journal_path, ann_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+
+            # Write-then-rename so a crash never leaves a half-written index
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(index.vectors), allow_pickle=False)
+            with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(index.row_ids, f)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(ids_path + ".tmp", ids_path)
+            if index.ann is not None:
+                index.ann.save(ann_path)
+            # Replaying a journal over a newer snapshot is harmless, so a
+            # crash before this line loses nothing
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+
+    def _append(self, table: str, line: bytes, rows: int):
+        """Journal one mutation, compacting the table when the journal has grown enough."""
+        if not self.directory:
+            return
+        with open(self._paths(table)[2], "ab") as f:
+            f.write(line)
+        self._journaled[table] = self._journaled.get(table, 0) + rows
+        index = self.tables.get(table)
+        size = len(index) if index is not None else 0
+        if index is None or self._journaled[table] > max(self.journal_min_rows, self.journal_share * size):
+            self.save(table)
+
+    def upsert(self, table: str, row_ids: List[str], vectors: np.ndarray):
+        check_table_name(table)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(row_ids), self.dimension):
+            raise ValueError(f"Expected {len(row_ids)} vectors of dimension {self.dimension}")
+        with self._lock:
+            index = self.tables.get(table)
+            if index is None:
+                index = self.tables[table] = TableIndex(self.dimension)
+            index.upsert(row_ids, vectors)
+            self._append(table, journal_line("upsert", row_ids, vectors), len(row_ids))
+            self._maybe_build_ann(table, index)
+
+    def delete(self, table: str, row_ids: List[str]) -> int:
+        with self._lock:
+            index = self.tables.get(check_table_name(table))
+            if index is None:
+                return 0
+            deleted = index.delete(row_ids)
+            if len(index) == 0:
+                del self.tables[table]
+            if deleted:
+                self._append(table, journal_line("delete", row_ids), len(row_ids))
+                self._maybe_build_ann(table, index)
+            return deleted
+
+    def get(self, table: str, row_ids: List[str]):
+        """(vectors, found) for the row_ids present in `table`, in request order."""
+        with self._lock:
+            index = self.tables.get(check_table_name(table))
+            found = [row_id for row_id in row_ids if index is not None and row_id in index.slots]
+            if not found:
+                return np.empty((0, self.dimension), dtype=np.float32), found
+            slots = np.fromiter((index.slots[row_id] for row_id in found), dtype=np.intp, count=len(found))
+            return index.vectors[slots], found
+
+    def table(self, table: str):
+        """A read-only snapshot of (vectors, row_ids) of one table, safe to use
+        outside the lock. Not a copy: a mutation meanwhile copies the table's
+        matrix rather than writing into the snapshot."""
+        with self._lock:
+            index = self.tables.get(check_table_name(table))
+            if index is None:
+                return np.empty((0, self.dimension), dtype=np.float32), []
+            return index.snapshot()
+
+    def search(
+        self,
+        query: np.ndarray,
+        tables: Optional[List[str]] = None,
+        limit: int = 5,
+        min_score: float = 0.3,
+    ) -> List[dict]:
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            names = list(self.tables) if not tables else [t for t in tables if t in self.tables]
+            matches = []
+            for table in names:
+                index = self.tables[table]
+                slots, scores = index.search(query, limit, min_score)
+                matches.extend(
+                    {"rowId": index.row_ids[slot], "tableName": table, "similarity": float(score)}
+                    for slot, score in zip(slots, scores)
+                )
+
+        matches.sort(key=lambda m: m["similarity"], reverse=True)
+        return matches[:limit]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "journaled": {name: rows for name, rows in self._journaled.items() if rows},
+                "tables": {name: len(index) for name, index in self.tables.items()},
+                "ann": {
+                    name: index.ann.snapshot()
+                    for name, index in self.tables.items()
+                    if index.ann is not None
+                },
+                "ann_building": sorted(self._ann_builds),
+                "vectors": sum(len(index) for index in self.tables.values()),
+            }
@@ -0,0 +1,158 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_cache import cache_key
+
+KEY_BYTES = 16
+
+
+def model_directory(root: str, model_id: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+    return os.path.join(root, safe)
+
+
+class VectorStore:
+    """Append-only, content-addressed vectors of one model on disk.
+
+    Rows are keyed by embedding_cache.cache_key(model_id, max_length, text),
+    so identical content is embedded once per model, whatever table or row
+    it belongs to. A directory per model id holds:
+
+        keys.bin     16-byte key per row
+        vectors.f32  float32 rows, read through a memory map
+        meta.json    model id, max_length and dimension
+        rows.json    {tableName: {rowId: key hex}} as of the last re-index
+
+    Vectors are appended before their keys, so after a crash any row
+    without a key is ignored and overwritten by the next append.
+    """
+
+    def __init__(self, root: str, model_id: str, max_length: int):
+        self.model_id = model_id
+        self.max_length = max_length
+        self.directory = model_directory(root, model_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.dimension: Optional[int] = None
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["model_id"] != model_id or meta["max_length"] != max_length:
+                raise ValueError(f"{self.directory} holds vectors of {meta['model_id']} at {meta['max_length']}")
+            self.dimension = meta["dimension"]
+
+        self.slots: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        if self.dimension is not None:
+            keys = self._read_keys()
+            rows = os.path.getsize(self._vectors_path) // (4 * self.dimension)
+            for slot, key in enumerate(keys[:rows]):
+                self.slots[key] = slot
+            self._map()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.directory, "keys.bin")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def _rows_path(self) -> str:
+        return os.path.join(self.directory, "rows.json")
+
+    def _read_keys(self) -> List[bytes]:
+        if not os.path.exists(self._keys_path):
+            return []
+        with open(self._keys_path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % KEY_BYTES
+        return [data[i:i + KEY_BYTES] for i in range(0, usable, KEY_BYTES)]
+
+    def _map(self):
+        self._vectors = None
+        if self.slots:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(len(self.slots), self.dimension),
+            )
+
+    def key(self, text: str) -> bytes:
+        return cache_key(self.model_id, self.max_length, text)
+
+    def lookup(self, keys: List[bytes], out: np.ndarray) -> List[int]:
+        """Copy stored vectors into the matching rows of `out`.
+
+        Returns the positions in `keys` that are not stored.
+        """
+        missing, found, slots = [], [], []
+        for i, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                missing.append(i)
+            else:
+                found.append(i)
+                slots.append(slot)
+        if found:
+            out[found] = self._vectors[np.asarray(slots, dtype=np.intp)]
+        return missing
+
+    def add(self, keys: List[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"model_id": self.model_id, "max_length": self.max_length, "dimension": self.dimension}, f)
+
+        fresh, seen = [], set()
+        for i, key in enumerate(keys):
+            if key not in self.slots and key not in seen:
+                seen.add(key)
+                fresh.append(i)
+        if not fresh:
+            return
+
+        # Write at the logical end so rows orphaned by a crash are overwritten
+        count = len(self.slots)
+        for path, data, width in (
+            (self._vectors_path, vectors[fresh].tobytes(), 4 * self.dimension),
+            (self._keys_path, b"".join(keys[i] for i in fresh), KEY_BYTES),
+        ):
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(count * width)
+                f.write(data)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+        for slot, i in enumerate(fresh, start=count):
+            self.slots[keys[i]] = slot
+        self._map()
+
+    def load_rows(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self._rows_path):
+            return {}
+        with open(self._rows_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_rows(self, rows: Dict[str, Dict[str, str]]):
+        with open(self._rows_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        os.replace(self._rows_path + ".tmp", self._rows_path)
+
+    def snapshot(self) -> dict:
+        return {
+            "directory": self.directory,
+            "model_id": self.model_id,
+            "vectors": len(self.slots),
+            "dimension": self.dimension,
+            "bytes": len(self.slots) * (self.dimension or 0) * 4,
+        }
@@ -0,0 +1,70 @@
+import fcntl
+import os
+import tempfile
+from typing import List, Optional
+
+# /proc/<pid>/status fields reported per worker (kB in the file, bytes here)
+MEMORY_FIELDS = {"VmRSS": "rss", "RssAnon": "rss_anon", "RssFile": "rss_file", "RssShmem": "rss_shmem"}
+
+
+def memory_status(pid: str = "self") -> dict:
+    """RSS split into private (anon) and file-backed pages, plus PSS.
+
+    Shared model pages show up in rss_file of every worker; PSS divides
+    them between the processes mapping them, so summing PSS over workers
+    gives the real total.
+    """
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in MEMORY_FIELDS:
+                    usage[MEMORY_FIELDS[key]] = int(value.split()[0]) * 1024
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    usage["pss"] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+class WorkerSlot:
+    """Slot i of `workers` sibling processes, pinned to its share of the CPUs.
+
+    Uvicorn does not number its workers, so each one takes the first free
+    lock file named after the shared parent pid. A restarted worker picks
+    up the slot (and cores) its crashed predecessor released.
+    """
+
+    def __init__(self, workers: int, pin: bool = True):
+        self.workers = workers
+        self.index: Optional[int] = None
+        self.cpus: List[int] = sorted(os.sched_getaffinity(0))
+        self._lock = None
+
+        for index in range(workers):
+            path = os.path.join(tempfile.gettempdir(), f"embedding-worker-{os.getppid()}-{index}.lock")
+            handle = open(path, "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                continue
+            self.index, self._lock = index, handle
+            break
+
+        if pin and self.index is not None and len(self.cpus) >= workers:
+            share = len(self.cpus) // workers
+            self.cpus = self.cpus[self.index * share:(self.index + 1) * share]
+            os.sched_setaffinity(0, self.cpus)
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "slot": self.index,
+            "workers": self.workers,
+            "cpus": self.cpus,
+            "memory": memory_status(),
+        }